@@ -6,11 +6,30 @@ Created on Tue Mar 29 18:39:20 2022
 @author: hemerson
 """
 
-import random, math, pickle
+import random, math, multiprocessing, time, json, logging
 import numpy as np
 
-from board_utils import get_moves, update_board
-from agent_utils import hash_board, init_zobrist
+from board_utils import get_packed_move_generator
+from move_utils import pack_moves, unpack_move, make_move, unmake_move, move_from, MAX_SIZE
+from agent_utils import hash_board, hash_packed_move, init_zobrist, canonical_hash, evaluate_board, score_move
+from transposition import TranspositionTable
+from tree import Node
+from book import OpeningBook, build_book, BOOK_MIN_PLAYS
+from tablebase import Tablebase
+from batch_utils import batch_playout, batch_child_keys, MIN_PLAYOUT_BATCH, MIN_CHILD_KEYS_BATCH
+from kernels import random_playout, seed_kernels
+from search_stats import SearchStats
+
+# search statistics are logged here as JSON when log_stats is set
+logger = logging.getLogger(__name__)
+
+# settings of the actor sent to the worker processes with each search, so 
+# that changes made after the workers are started are used
+WORKER_SETTINGS = ('UCB', 'playout_policy', 'playout_cutoff', 'playout_batch')
+
+# a search to a node budget stops after this many simulations in a row add
+# no nodes, which happens when every line from the root has been played out
+MAX_STALLED_SIMS = 100
 
 """
 Defines a template class for the agent.
@@ -78,170 +97,658 @@ class Random_Actor(Actor):
 Defines the Monte Carlo Tree Search Agent
 """
 class MCTS_Actor(Actor): 
-    def __init__(self,  player, size):
+    def __init__(self,  player, size, backend='numpy', memory_mb=64, workers=1, parallel='root', playout_batch=1, symmetric=False):
         super().__init__(player)
         
+        # the search holds moves as packed integers, which limits the board size
+        assert size <= MAX_SIZE, "The MCTS agent only supports boards up to size {}".format(MAX_SIZE)
+        
         # specifiy the learning parameters
         self.number_sims = 100
         self.UCB = 1.5
         self.size = size
         
+        # optional limits on the search replacing number_sims, given as the
+        # seconds per move and the number of nodes expanded per move
+        self.time_budget = None
+        self.node_budget = None
+        self.nodes_expanded = 0
+        self.sims_completed = 0
+        
+        # the search tree is kept between moves and re-rooted on the new position
+        self.reuse_tree = True
+        self.root = None
+        
+        # background search process on the opponent's turn, with the event 
+        # which stops it and the shared count of its simulations
+        self.ponder_process = None
+        self.ponder_stop = None
+        self.ponder_count = None
+        self.ponder_sims = 0
+        
+        # number of processes searching in parallel, either with separate
+        # trees merged at the root ('root') or a single shared tree ('tree')
+        assert parallel in ('root', 'tree'), "Parallel must be 'root' or 'tree'"
+        self.workers = workers
+        self.parallel = parallel
+        
+        # the worker processes are started by the first parallel search and 
+        # kept until close is called, with the table and tablebase they were given
+        self.pool = None
+        self.pool_objects = None
+        
+        # number of simulations whose new leaves are played out together by a
+        # single batched playout, which picks moves uniformly whatever the 
+        # playout policy, before their outcomes are backpropagated. Smaller 
+        # batches are slower than playing each leaf out on its own
+        assert playout_batch == 1 or playout_batch >= MIN_PLAYOUT_BATCH, "Playout batch must be 1 or at least {}".format(MIN_PLAYOUT_BATCH)
+        self.playout_batch = playout_batch
+        
+        # in-flight visits added to each state on the path of a simulation
+        # so that the workers searching a shared tree, or the simulations of
+        # a batch, explore different moves
+        self.virtual_loss = 1 if parallel == 'tree' or playout_batch > 1 else 0
+        
+        # the playout either picks moves uniformly ('light'), runs the same
+        # playout as a compiled kernel ('kernel') or favours captures, 
+        # promotions and safe moves ('heavy'), and if a cutoff is set the 
+        # light and heavy playouts stop after that many moves and evaluate the board
+        self.playout_policy = 'light'
+        self.playout_cutoff = None
+        
+        # select the move generation backend ('numpy', 'bitboard' or 'kernel')
+        self.packed_move_generator = get_packed_move_generator(backend)
+        
         # get the enemy colour
         if self.player == 'white': self.enemy_player = 'black'
         else: self.enemy_player = 'white'            
         
         # STATISTICS 
-        self.values = dict()
-        self.plays = dict()
+        # plays and values are held in a fixed size table of memory_mb megabytes
+        self.table = TranspositionTable(memory_mb=memory_mb)
         self.history = []
         
+        # moves are played from the opening book without searching when at 
+        # least book_coverage of the moves lead to book positions with at 
+        # least book_min_plays plays
+        self.book = None
+        self.book_min_plays = BOOK_MIN_PLAYS
+        self.book_coverage = 0.5
+        
+        # exact results of endgames with few pieces used to end simulations
+        self.tablebase = None
+        
+        # TELEMETRY
+        # the statistics of the last search are kept in stats, while 
+        # search_stats collects those of the search in progress
+        self.stats = None
+        self.search_stats = SearchStats()
+        self.log_stats = False
+        
         # HASHING
+        # if symmetric, a position and its mirror image with the colours
+        # swapped share an entry in the table, with the sign of the value flipped,
+        # so saved statistics can only be loaded by agents with the same setting
         self.size = size
-        self.hash_table = init_zobrist(self.size)
+        self.symmetric = symmetric
+        self.hash_table = init_zobrist(self.size, symmetric=symmetric)
         
     """
     Consider the available moves and selects the opitmal move
     returning the piece location (tuple), move location (list) 
-    and coords of pieces taken (list of np arrays).     
+    and coords of pieces taken (list of np arrays). The search runs
+    for number_sims simulations unless a time or node budget is set,
+    and the number completed is saved in sims_completed. The statistics
+    of the search are saved in stats. The hash of the board can be passed 
+    in if it is already known, such as from a board which keeps its hash.
     """      
-    def select_action(self, input_possible_moves, input_pieces_taken, input_board):     
+    def select_action(self, input_possible_moves, input_pieces_taken, input_board, time_budget=None, node_budget=None, input_hash=None):     
+        
+        # finish any search on the opponent's turn, keeping its tree
+        self.stop_pondering()
+        
+        # start collecting the statistics of this search
+        stats = self.search_stats = SearchStats()
+        search_start = time.perf_counter()
+        start_counts = (self.nodes_expanded, self.table.probes, self.table.hits)
+        
+        # get the limits of the search
+        if time_budget is None: time_budget = self.time_budget
+        if node_budget is None: node_budget = self.node_budget
+        deadline = None
+        if time_budget is not None: 
+            deadline = time.time() + time_budget
         
         # ensure jump moves are prioritised if possible
         input_corrected_moves = self.ensure_jump(input_possible_moves, input_pieces_taken) 
-        input_hash = hash_board(input_board, self.size, self.hash_table)
+        if input_hash is None:
+            input_hash = hash_board(input_board, self.size, self.hash_table, self.player)
+            stats.hashes += 1
         
         # add the original state
-        if input_hash not in self.values:            
-            self.plays[input_hash] = 0
-            self.values[input_hash] = 0   
+        self.table.next_generation()
+        self.table.store(self.table_key(input_hash)[0])
+        
+        # continue from the previous search tree if it reached this position,
+        # otherwise create the root of a new search tree
+        root = self.find_subtree(input_hash) if self.reuse_tree else None
+        if root is None:
+            root = Node(input_hash, self.player)
+        if not root.expanded:
+            self.expand(root, input_board, input_corrected_moves, input_pieces_taken)
+        
+        # play from the opening book if it covers this position
+        action = self.book_action(root)
+        if action is not None:
+            self.sims_completed = 0
+            self.root = root.child(action, self.enemy_player)
+            self.record_stats(root, search_start, start_counts)
+            return unpack_move(root.moves[action], self.size)
+            
+        if self.workers > 1 and self.parallel == 'tree':
+            self.sims_completed = self.tree_parallel_search(input_board, deadline, node_budget)
+        elif self.workers > 1:
+            self.sims_completed = self.root_parallel_search(input_board, deadline, node_budget)
+        else:
+            self.sims_completed = self.run_simulations(root, input_board, self.number_sims, deadline, node_budget)
+        
+        # keep the subtree of the chosen move for the next search and
+        # discard the rest of the tree
+        choice_start = time.perf_counter()
+        action = self.choose_action(root)
+        stats.phase_times['choice'] += time.perf_counter() - choice_start
+        self.root = root.child(action, self.enemy_player)
+        self.record_stats(root, search_start, start_counts)
+        
+        # return the chosen_piece, chosen_move, chosen_take
+        return unpack_move(root.moves[action], self.size)
+    
+    
+    """
+    Finish the statistics of the search from the root and save them in stats,
+    logging them if log_stats is set. The start counts are the nodes expanded
+    and the table lookups and hits before the search, and the counts of any
+    worker processes have already been added.
+    """
+    def record_stats(self, root, search_start, start_counts):
+        
+        stats = self.search_stats
+        stats.total_time = time.perf_counter() - search_start
+        stats.simulations = self.sims_completed
+        stats.nodes_expanded += self.nodes_expanded - start_counts[0]
+        stats.table_probes += self.table.probes - start_counts[1]
+        stats.table_hits += self.table.hits - start_counts[2]
+        stats.tree_size = self.tree_size(root)
+        self.stats = stats
+        
+        if self.log_stats:
+            logger.info(json.dumps(stats.as_dict()))
+    
+    
+    """
+    Return the number of nodes in the tree below (and including) the node.
+    """
+    def tree_size(self, node):
+        
+        number_nodes, stack = 0, [node]
+        while stack:
+            node = stack.pop()
+            number_nodes += 1
+            stack.extend(child for child in node.children if child is not None)
+            
+        return number_nodes
+    
+    
+    """
+    Start searching in a background process from the board after this player 
+    has moved, while the opponent decides on their move. The process updates
+    the statistics in a shared memory table, which the next call to 
+    select_action continues from. The search runs alongside that of the 
+    opponent when there is a spare core.
+    """
+    def start_pondering(self, board_data):
+        
+        self.stop_pondering()
+        
+        # the process adds its statistics to the same table
+        self.table.share()
+        
+        # the opponent is to move on the board
+        input_hash = hash_board(board_data, self.size, self.hash_table, self.enemy_player)
+        root = self.find_subtree(input_hash)
+        if root is None:
+            root = Node(input_hash, self.enemy_player)
+        self.root = root
+        
+        self.ponder_sims = 0
+        stop, count = multiprocessing.Event(), multiprocessing.Value('i', 0)
+        process = multiprocessing.Process(target=_ponder, args=(self, root, board_data.copy(), stop, count), daemon=True)
+        process.start()
+        self.ponder_process, self.ponder_stop, self.ponder_count = process, stop, count
+    
+    
+    """
+    Run simulations from the root until told to stop, counting them in the
+    shared count.
+    """
+    def ponder(self, root, board_data, stop, count):
+        
+        self.table.store(self.table_key(root.key)[0])
+        if not root.expanded:
+            self.expand(root, board_data)
+        
+        while root.moves and not stop.is_set():
+            self.simulate_batch(root, board_data, self.playout_batch)
+            count.value += self.playout_batch
+    
+    
+    """
+    Stop the background search and wait for its simulation to finish.
+    """
+    def stop_pondering(self):
+        
+        if self.ponder_process is None:
+            return
+        
+        self.ponder_stop.set()
+        self.ponder_process.join()
+        self.ponder_sims = self.ponder_count.value
+        self.ponder_process = None
+        self.ponder_stop = None
+        self.ponder_count = None
+        
+        # count the entries added by the process
+        self.table.recount()
+    
+    
+    """
+    Split the simulations between a pool of worker processes which each search 
+    independently from the root, then merge the statistics of the root and 
+    its children back into the table.
+    """
+    def root_parallel_search(self, input_board, deadline=None, node_budget=None):
+        
+        # each worker started with a copy of the statistics and keeps its own
+        tasks = self.parallel_tasks(input_board, deadline, node_budget)
+        results = self.worker_pool().map(_root_search, tasks)
+        
+        # merge the changes and statistics of each worker
+        for keys, delta_plays, delta_values, sims, stats in results:
+            self.table.merge(keys, delta_plays, delta_values)
+            self.search_stats.add(stats)
+            
+        return sum(result[3] for result in results)
+    
+    
+    """
+    Split the simulations between a pool of worker processes which all search
+    the same tree, with the statistics held in a shared memory table.
+    """
+    def tree_parallel_search(self, input_board, deadline=None, node_budget=None):
+        
+        # the workers update the table in place
+        self.table.share()
+        tasks = self.parallel_tasks(input_board, deadline, node_budget)
+        results = self.worker_pool().map(_tree_search, tasks)
+            
+        # count the entries added by the workers and remove any in-flight 
+        # visits left by simulations on entries which were replaced
+        self.table.recount()
+        self.table.virtual.fill(0)
+        
+        for sims, stats in results:
+            self.search_stats.add(stats)
+        
+        return sum(result[0] for result in results)
+    
+    
+    """
+    Share the simulations (or node budget) between the workers, giving each a 
+    random seed. Every worker searches until the same deadline.
+    """
+    def parallel_tasks(self, input_board, deadline=None, node_budget=None):
+        
+        sims_per_worker = [self.number_sims // self.workers + (i < self.number_sims % self.workers) for i in range(self.workers)]
+        nodes_per_worker = [None] * self.workers
+        if node_budget is not None:
+            nodes_per_worker = [max(node_budget // self.workers, 1)] * self.workers
+        seeds = np.random.randint(2**31 - 1, size=self.workers)
+        
+        # the simulation count is ignored when searching to a budget
+        settings = {name: getattr(self, name) for name in WORKER_SETTINGS}
+        tasks = list()
+        for number_sims, number_nodes, seed in zip(sims_per_worker, nodes_per_worker, seeds):
+            if number_sims > 0 or deadline is not None or node_budget is not None:
+                tasks.append((input_board, number_sims, seed, deadline, number_nodes, settings))
+        
+        return tasks
+    
+    
+    """
+    Return the pool of worker processes, starting it if needed. Each worker
+    holds a copy of the actor, so the pool is started again if the table or 
+    tablebase has been replaced since (a shared table is updated in place).
+    """
+    def worker_pool(self):
+        
+        if self.pool is not None and any(current is not used for current, used in zip((self.table, self.tablebase), self.pool_objects)):
+            self.close()
+        
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self,))
+            self.pool_objects = (self.table, self.tablebase)
+            
+        return self.pool
+    
+    
+    """
+    Stop any background search and the worker processes. The actor can 
+    still be used, starting the workers again if they are needed.
+    """
+    def close(self):
+        
+        self.stop_pondering()
+        
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            self.pool_objects = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    """
+    Pickle the actor without its worker or pondering processes, such as 
+    when it is copied into a worker.
+    """
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('pool', 'pool_objects', 'ponder_process', 'ponder_stop', 'ponder_count'):
+            state[name] = None
+        return state
+    
+    
+    """
+    Run simulations from the root until the number of simulations is reached,
+    or when a budget is given until the deadline passes or the number of nodes 
+    expanded reaches the node budget. Returns the number of simulations run.
+    """
+    def run_simulations(self, root, input_board, number_sims, deadline=None, node_budget=None):
+        
+        sims = 0
+        start_nodes = self.nodes_expanded
+        stalled_sims = 0
+        
+        # every simulation makes and then unmakes its moves on the same board
+        search_board = input_board.copy()
+        
+        while True:
+            
+            # check the limits of the search, always running one simulation
+            if deadline is None and node_budget is None and sims >= number_sims: 
+                break
+            if deadline is not None and sims > 0 and time.time() >= deadline: 
+                break
+            if node_budget is not None and sims > 0 and self.nodes_expanded - start_nodes >= node_budget: 
+                break
+            if node_budget is not None and stalled_sims >= MAX_STALLED_SIMS:
+                break
+            
+            # run a batch of simulations, with no more than are left to run or
+            # than the nodes left in the budget since each may expand a node
+            batch_size = self.playout_batch
+            if deadline is None and node_budget is None:
+                batch_size = min(batch_size, number_sims - sims)
+            if node_budget is not None:
+                batch_size = max(min(batch_size, node_budget - self.nodes_expanded + start_nodes), 1)
+            
+            sim_nodes = self.nodes_expanded
+            self.simulate_batch(root, search_board, batch_size)
+            sims += batch_size
+            
+            if self.nodes_expanded == sim_nodes: stalled_sims += batch_size
+            else: stalled_sims = 0
+            
+        return sims
+    
+    
+    """
+    Run a batch of simulations from the root. With more than one simulation
+    the leaves they reach are played out together once they have all been
+    selected, and the in-flight visits of each spread them across the tree.
+    """
+    def simulate_batch(self, root, current_board, batch_size):
+        
+        if batch_size == 1:
+            self.simulate(root, current_board)
+            return
+        
+        leaves = []
+        for _ in range(batch_size):
+            self.simulate(root, current_board, leaves)
+        self.playout_leaves(leaves)
+    
+    
+    """
+    Play out the leaves kept by a batch of simulations with a single batched
+    playout, then remove their in-flight visits and backpropagate the outcomes.
+    """
+    def playout_leaves(self, leaves):
+        
+        if not leaves:
+            return
+        
+        stats = self.search_stats
+        start = time.perf_counter()
+        
+        boards, players, max_move_counts, histories = zip(*leaves)
+        outcomes, playout_moves = batch_playout(np.stack(boards), players, self.size, np.array(max_move_counts))
+        stats.playouts += len(leaves)
+        stats.playout_moves += int(playout_moves.sum())
+        stats.moves_made += int(playout_moves.sum())
+        
+        played_out = time.perf_counter()
+        stats.phase_times['playout'] += played_out - start
+        
+        for outcome, history in zip(outcomes.tolist(), histories):
+            if self.virtual_loss:
+                for hash_num in history[1:]:
+                    self.table.add_virtual(self.table_key(hash_num)[0], -self.virtual_loss)
             
-        for i in range(self.number_sims):   
+            self.history = history
+            self.backpropagate(outcome)
+        
+        stats.phase_times['backpropagation'] += time.perf_counter() - played_out
+    
+    
+    """
+    Run a single simulation from the root node, updating the 
+    statistics of the states visited. The moves are made on the board
+    and unmade at the end, so it is left as it was. If a list of leaves 
+    is given a leaf which needs a playout is added to it instead, keeping 
+    its in-flight visits until the leaf is played out.
+    """
+    def simulate(self, root, current_board, leaves=None):
+        
+        # clear the history 
+        self.history.clear()
+        self.history.append(root.key)
+        
+        # the moves made and the kings they took, to unmake at the end
+        made_moves = []
+        
+        # reset the state
+        node = root
+        if not node.expanded:
+            self.expand(node, current_board)
+        player = node.player
+        
+        stalemate = False
+        outcome = None
+        move_count = 0
+        max_move_count = 200
+        
+        # time each phase of the simulation
+        stats = self.search_stats
+        start = time.perf_counter()
+        
+        # SELECTION: -----------------------------------------------------------------------
+        # picks a successor by applying the UCB strategy
+        # as long as statistics exist for all successors
+        
+        new_children = self.unvisited_children(node)
+        playable_moves = bool(node.moves)
+        
+        # while all the possible moves have already been made and the game is not over 
+        while not new_children and playable_moves and not stalemate: 
+        
+            # choose an action using UCB and update the board
+            action = self.selection(node)
+            made_moves.append((node.moves[action], make_move(node.moves[action], current_board, self.size)))
             
-            # clear the history 
-            self.history.clear()
-            current_board = input_board.copy()
-            self.history.append(input_hash)
+            # update the current player
+            if player == self.player: player = self.enemy_player
+            else: player = self.player
             
-            # reset the state
-            corrected_moves = input_corrected_moves
-            pieces_taken = input_pieces_taken
-            player = self.player
+            # move to the child and get its moves
+            node = node.child(action, player)
+            self.history.append(node.key)     
+            if self.virtual_loss:
+                self.table.add_virtual(self.table_key(node.key)[0], self.virtual_loss)
+            if not node.expanded:
+                self.expand(node, current_board)
             
-            stalemate = False
-            move_count = 0
-            max_move_count = 200
+            # update the loop condition
+            new_children = self.unvisited_children(node)
+            playable_moves = bool(node.moves)
+            stalemate = np.count_nonzero(current_board) < 3
             
-            # SELECTION: -----------------------------------------------------------------------
-            # picks a successor by applying the UCB strategy
-            # as long as statistics exist for all successors
+            move_count += 1                
+            if move_count > max_move_count: stalemate = True
             
-            previously_visited, new_moves, new_pieces_taken = self.new_playable_states(corrected_moves, pieces_taken, current_board, player)
-            playable_moves = bool(corrected_moves)
+            # end the simulation with the exact result of a small endgame
+            outcome = self.probe_tablebase(current_board, player)
+            if outcome is not None: playable_moves = False
+        
+        selected = time.perf_counter()
+        stats.phase_times['selection'] += selected - start
+        
+        # EXPANSION: -----------------------------------------------------------------------------
+        # picks a random successor (with no statistics) and adds it to the statistics
+        
+        if playable_moves and not stalemate: 
             
-            # while all the possible moves have already been made and the game is not over 
-            while previously_visited and playable_moves and not stalemate: 
+            # randomly select a move which has not been played
+            action = random.choice(new_children)
+            made_moves.append((node.moves[action], make_move(node.moves[action], current_board, self.size)))
             
-                # choose an action using UCB and update the board
-                chosen_piece, chosen_move, chosen_take = self.selection(corrected_moves, pieces_taken, current_board, player)                  
-                new_board = update_board(player, chosen_piece, chosen_move, chosen_take, current_board, self.size) 
-                new_board_hash = hash_board(new_board, self.size, self.hash_table)
-                self.history.append(new_board_hash)     
-                
-                # update the current player
-                if player == self.player: player = self.enemy_player
-                else: player = self.player
-                
-                # update the moves for the new board
-                possible_moves, pieces_taken = get_moves(player, new_board, self.size)
-                corrected_moves = self.ensure_jump(possible_moves, pieces_taken) 
-                current_board = new_board
-                
-                # update the loop condition
-                previously_visited, new_moves, new_pieces_taken = self.new_playable_states(corrected_moves, pieces_taken, current_board, player)
-                playable_moves = bool(corrected_moves)
-                stalemate = np.count_nonzero(current_board) < 3
-                
-                move_count += 1                
-                if move_count > max_move_count: stalemate = True
+            # update the current player
+            if player == self.player: player = self.enemy_player
+            else: player = self.player       
             
-            # EXPANSION: -----------------------------------------------------------------------------
-            # picks a random successor (with no statistics) and adds it to the statistics
+            # update statistics
+            node = node.child(action, player)
+            self.history.append(node.key)
+            table_key = self.table_key(node.key)[0]
+            self.table.store(table_key)
+            if self.virtual_loss:
+                self.table.add_virtual(table_key, self.virtual_loss)
             
-            if playable_moves and not stalemate: 
-                
-                # randomly select a piece from possible pieces
-                chosen_piece, moves = random.choice(list(new_moves.items()))
-
-                # randomly select a move for that piece
-                chosen_index = np.random.choice(moves.shape[0], size=1, replace=False)
-                chosen_move = moves[chosen_index, :][-1, :]
-                
-                # get the taken pieces
-                chosen_take = []
-                if len(new_pieces_taken) > 0:                    
-                    chosen_take = new_pieces_taken[chosen_piece][chosen_index[0]]
-                    
-                new_board = update_board(player, chosen_piece, chosen_move, chosen_take, current_board, self.size) 
-                new_board_hash = hash_board(new_board, self.size, self.hash_table)
-                
-                # update statistics
-                self.history.append(new_board_hash)
-                self.plays[new_board_hash] = 0
-                self.values[new_board_hash] = 0
-                    
-                # update the current player
-                if player == self.player: player = self.enemy_player
-                else: player = self.player       
-                
-                # update the moves for the new board
-                possible_moves, new_pieces_taken = get_moves(player, new_board, self.size)
-                new_moves = self.ensure_jump(possible_moves, new_pieces_taken) 
-                current_board = new_board
-                
-                # update the loop condition
-                playable_moves = bool(new_moves)
-                stalemate = np.count_nonzero(new_board) < 3
-                
-                move_count += 1                
-                if move_count > max_move_count: stalemate = True
+            # update the moves for the new board, which counts as a node expanded
+            new_moves = self.packed_move_generator(player, current_board, self.size)
+            stats.move_generations += 1
+            self.nodes_expanded += 1
             
-            # (LIGHT) PLAYOUT: ---------------------------------------------------------------
-            # picks random successors until the end of the play
+            # update the loop condition
+            playable_moves = bool(new_moves)
+            stalemate = np.count_nonzero(current_board) < 3
             
-            while playable_moves and not stalemate:
-                                
+            move_count += 1                
+            if move_count > max_move_count: stalemate = True
+            
+            # end the simulation with the exact result of a small endgame
+            outcome = self.probe_tablebase(current_board, player)
+            if outcome is not None: playable_moves = False
+        
+        expanded = time.perf_counter()
+        stats.phase_times['expansion'] += expanded - selected
+        
+        # (BATCHED) PLAYOUT: -------------------------------------------------------------
+        # keeps the leaf to be played out with the rest of the batch
+        
+        deferred = leaves is not None and playable_moves and not stalemate
+        if deferred:
+            leaves.append((current_board.copy(), player, max_move_count - move_count, self.history[:]))
+            playable_moves = False
+        
+        # (KERNEL) PLAYOUT: --------------------------------------------------------------
+        # plays the random game in a compiled kernel, using Numba if it is installed
+        
+        if self.playout_policy == 'kernel' and playable_moves and not stalemate:
+            outcome, playout_moves = random_playout(current_board, player, self.size, max_move_count - move_count)
+            playable_moves = False
+            stats.playouts += 1
+            stats.playout_moves += playout_moves
+            stats.moves_made += playout_moves
+        
+        # (LIGHT OR HEAVY) PLAYOUT: ------------------------------------------------------
+        # picks random successors until the end of the play or the cutoff
+        
+        playout_count = 0
+        while playable_moves and not stalemate:
+            
+            # stop early and estimate the outcome from the board
+            if self.playout_cutoff is not None and playout_count >= self.playout_cutoff:
+                outcome = evaluate_board(current_board, self.size)
+                break
+            playout_count += 1
+            
+            if self.playout_policy == 'heavy':
+                chosen = self.heavy_playout_move(player, new_moves, current_board)
+            
+            else:                
                 # randomly select a piece from possible pieces
-                chosen_piece, moves = random.choice(list(new_moves.items()))
-
+                chosen_piece = random.choice(list({move_from(move) for move in new_moves}))
+    
                 # randomly select a move for that piece
-                chosen_index = np.random.choice(moves.shape[0], size=1, replace=False)
-                chosen_move = moves[chosen_index, :][-1, :]
-                
-                # get the taken pieces
-                chosen_take = []
-                if len(new_pieces_taken) > 0:
-                    chosen_take = new_pieces_taken[chosen_piece][chosen_index[0]]                                                                      
-                    
-                new_board = update_board(player, chosen_piece, chosen_move, chosen_take, current_board, self.size) 
-                
-                # update the current player
-                if player == self.player: player = self.enemy_player
-                else: player = self.player      
-                    
-                # update the moves for the new board
-                possible_moves, new_pieces_taken = get_moves(player, new_board, self.size)
-                new_moves = self.ensure_jump(possible_moves, new_pieces_taken) 
-                current_board = new_board
+                chosen = random.choice([move for move in new_moves if move_from(move) == chosen_piece])
                 
-                # update the loop condition
-                playable_moves = bool(new_moves)
-                stalemate = np.count_nonzero(new_board) < 3
+            made_moves.append((chosen, make_move(chosen, current_board, self.size)))
+            
+            # update the current player
+            if player == self.player: player = self.enemy_player
+            else: player = self.player      
                 
-                move_count += 1                
-                if move_count > max_move_count: stalemate = True
+            # update the moves for the new board
+            new_moves = self.packed_move_generator(player, current_board, self.size)
+            stats.move_generations += 1
+            
+            # update the loop condition
+            playable_moves = bool(new_moves)
+            stalemate = np.count_nonzero(current_board) < 3
             
-            # BACKPROPAGATION: ------------------------------------------------------------
-            # updates the statistics of states in history   
+            move_count += 1                
+            if move_count > max_move_count: stalemate = True
+            
+            # end the simulation with the exact result of a small endgame
+            outcome = self.probe_tablebase(current_board, player)
+            if outcome is not None: playable_moves = False
+        
+        if playout_count > 0:
+            stats.playouts += 1
+            stats.playout_moves += playout_count
+        
+        played_out = time.perf_counter()
+        stats.phase_times['playout'] += played_out - expanded
+        
+        # BACKPROPAGATION: ------------------------------------------------------------
+        # updates the statistics of states in history   
+        
+        if outcome is None:
             
             # black loses
             if player == 'black': 
@@ -253,117 +760,188 @@ class MCTS_Actor(Actor):
                 
             if stalemate: 
                 outcome = 0
-            
-            self.backpropagate(outcome) 
-            
-        # Choose the action to maximise/minimise the value
         
-        # get the action hashes
-        action_hash_val = list()
-            
-        # get the starting location and action corresponding to the hash
-        actions_to_take = list()
+        # restore the board
+        stats.moves_made += len(made_moves)
+        for move, king_mask in reversed(made_moves):
+            unmake_move(move, king_mask, current_board, self.size)
         
-        # cycle through positions with available moves
-        for key, value in input_corrected_moves.items():
-            
-            # cycle through the possible moves at that position
-            for i in range(value.shape[0]):
-                
-                # create a copy of the array to avoid editing the original
-                current_board_copy = input_board.copy()
-                
-                chosen_piece = key
-                chosen_move = value[i, :]
-                chosen_take = []
-                
-                if key in input_pieces_taken:
-                    chosen_take = input_pieces_taken[key][i] 
+        # the leaf is backpropagated once the batch has been played out
+        if deferred:
+            return
+        
+        # remove the in-flight visits now the result is known
+        if self.virtual_loss:
+            for hash_num in self.history[1:]:
+                self.table.add_virtual(self.table_key(hash_num)[0], -self.virtual_loss)
+        
+        self.backpropagate(outcome) 
+        stats.phase_times['backpropagation'] += time.perf_counter() - played_out
+    
+    
+    """
+    Select a playout move with probability proportional to the exponential
+    of its score, so captures, promotions and safe moves are more likely.
+    """
+    def heavy_playout_move(self, player, moves, current_board):
+        
+        scores = [score_move(player, *unpack_move(move, self.size), current_board, self.size) for move in moves]
+        
+        weights = np.exp(scores)
+        chosen_index = np.random.choice(len(moves), p=weights / weights.sum())
+        
+        return moves[chosen_index]
+    
+    
+    """
+    Cache the legal moves of a node and the hashes of the positions 
+    they lead to. The moves can be passed in if they are already known.
+    """
+    def expand(self, node, current_board, possible_moves=None, pieces_taken=None):
+        
+        # get the packed moves for the board
+        if possible_moves is None:
+            moves = self.packed_move_generator(node.player, current_board, self.size)
+            self.search_stats.move_generations += 1
+        else:
+            moves = pack_moves(node.player, possible_moves, pieces_taken, current_board, self.size)
+        self.search_stats.hashes += len(moves)
+        
+        # get the hashes of the new states without updating the board, 
+        # all at once if there are enough moves for it to be faster
+        if len(moves) >= MIN_CHILD_KEYS_BATCH:
+            child_keys = batch_child_keys([node.key], current_board[None], [moves], self.size, self.hash_table).tolist()
+        else:
+            child_keys = [hash_packed_move(node.key, move, current_board, self.size, self.hash_table) for move in moves]
+        
+        node.moves.extend(moves)
+        node.child_keys.extend(child_keys)
+        node.children.extend([None] * len(moves))
                 
-                # get the new state and hash it
-                new_board = update_board(self.player, chosen_piece, chosen_move, chosen_take, current_board_copy, self.size)   
-                new_hash = hash_board(new_board, self.size, self.hash_table) 
-                action_hash_val.append(self.values[new_hash])                       
-                                                
-                # save the original position of the piece taking the action 
-                # and the row of the action
-                actions_to_take.append([chosen_piece, chosen_move, chosen_take])   
-        
-        if self.player == 'white':            
+        node.expanded = True
+        self.nodes_expanded += 1
+    
+    
+    """
+    Choose the index of the action from the root which maximises/minimises the value
+    """
+    def choose_action(self, node):
+        
+        # get the values of the actions
+        action_hash_val = [self.table_value(new_hash)[1] for new_hash in node.child_keys]
+        
+        if node.player == 'white':            
             max_vals = np.argwhere(action_hash_val == np.amax(action_hash_val))            
             action = np.random.choice(max_vals.flatten(), 1, replace=False)[0]            
             
-        elif self.player == 'black':
+        elif node.player == 'black':
             max_vals = np.argwhere(action_hash_val == np.amin(action_hash_val))            
             action = np.random.choice(max_vals.flatten(), 1, replace=False)[0]     
         
-        # return the chosen_piece, chosen_move, chosen_take
-        return actions_to_take[action][0], actions_to_take[action][1], actions_to_take[action][2]
+        return action
     
     
     """
-    Select an action using the upper confidence 
-    bound strategy (UCB)
+    Return the outcome of the board with the given player to move from the 
+    tablebase, or None if there is no tablebase or too many pieces.
     """
-    def selection(self, possible_actions, pieces_taken, current_board, player):
+    def probe_tablebase(self, current_board, player):
         
-        # get hash for the current board config        
-        current_hash = hash_board(current_board, self.size, self.hash_table)  
+        if self.tablebase is None:
+            return None
         
-        # get the action hashes
-        action_hash = list()
+        return self.tablebase.probe(current_board, player)
+    
+    
+    """
+    Choose the action from the opening book in the same way as choose_action,
+    only considering the moves which lead to book positions with enough plays. 
+    Returns None if there is no book or too few of the moves are covered.
+    """
+    def book_action(self, node):
+        
+        if self.book is None:
+            return None
+        
+        # get the book values of the actions
+        actions, action_book_val = [], []
+        for action, new_hash in enumerate(node.child_keys):
+            table_key, sign = self.table_key(new_hash)
+            plays, value = self.book.get(table_key)
+            if plays >= self.book_min_plays:
+                actions.append(action)
+                action_book_val.append(sign * value)
+        
+        if len(actions) == 0 or len(actions) < self.book_coverage * len(node.child_keys):
+            return None
+        
+        if node.player == 'white':
+            max_vals = np.argwhere(action_book_val == np.amax(action_book_val))
+        elif node.player == 'black':
+            max_vals = np.argwhere(action_book_val == np.amin(action_book_val))
+        
+        return actions[np.random.choice(max_vals.flatten(), 1, replace=False)[0]]
+    
+    
+    """
+    Return the node of the previous search tree for the given position if 
+    it is the root or one of the next two moves from it.
+    """
+    def find_subtree(self, input_hash):
         
-        # get the starting location and action corresponding to the hash
-        actions_to_take = list()
+        if self.root is None:
+            return None
         
-        # cycle through positions with available moves
-        for key, value in possible_actions.items():
+        if self.root.key == input_hash:
+            return self.root
+        
+        for child in self.root.children:
+            if child is None: continue
+            if child.key == input_hash:
+                return child
             
-            # cycle through the possible moves at that position
-            for i in range(value.shape[0]):
-                
-                # create a copy of the array to avoid editing the original
-                current_board_copy = current_board.copy()
-                
-                chosen_piece = key
-                chosen_move = value[i, :]
-                chosen_take = []
-                
-                if key in pieces_taken:
-                    chosen_take = pieces_taken[key][i] 
-                
-                # get the new state and hash it
-                new_board = update_board(player, chosen_piece, chosen_move, chosen_take, current_board_copy, self.size)   
-                new_hash = hash_board(new_board, self.size, self.hash_table)  
-                action_hash.append(new_hash)                
-                                
-                # save the original position of the piece taking the action 
-                # and the row of the action
-                actions_to_take.append([chosen_piece, chosen_move, chosen_take])
+            for grandchild in child.children:
+                if grandchild is not None and grandchild.key == input_hash:
+                    return grandchild
+        
+        return None
+    
+    
+    """
+    Select an action using the upper confidence 
+    bound strategy (UCB)
+    """
+    def selection(self, node):
                 
         # retrieve the Q_values for the possible states        
-        Q_val = np.zeros(len(action_hash))  
+        Q_val = np.zeros(len(node.child_keys))  
+        current_slot = self.table.store(self.table_key(node.key)[0])
+        
+        # if the current state has not been played count it as a single play
+        if self.table.plays[current_slot] == 0:
+            self.table.plays[current_slot] = 1
+            self.table.values[current_slot] = 0
+        current_log_plays = math.log(self.table.plays[current_slot])
+        
+        # count in-flight visits as losses for the player choosing the move
+        virtual_value = None
+        if self.virtual_loss:
+            virtual_value = -1 if node.player == 'white' else 1
         
-        for idx, hash_num in enumerate(action_hash):
+        for idx, hash_num in enumerate(node.child_keys):
         
             # calculate Q value        
-            try: Q_val[idx] = self.values[hash_num] + self.UCB * math.sqrt(math.log(self.plays[current_hash]) / self.plays[hash_num])  
-            
-            # if self.plays[current_hash] = 0
-            except ValueError:
-                Q_val[idx] = self.values[hash_num] + self.UCB * math.sqrt(math.log(1) / self.plays[hash_num]) 
-                self.plays[current_hash] = 1
-                self.values[current_hash] = 0
+            plays, value = self.table_value(hash_num, virtual_value)
+            Q_val[idx] = value + self.UCB * math.sqrt(current_log_plays / max(plays, 1))  
             
         # choose the action
-        if player == 'white':
+        if node.player == 'white':
             action = np.argmax(Q_val)
             
-        elif player == 'black':
+        elif node.player == 'black':
             action = np.argmin(Q_val)
         
-        # return the chosen_piece, chosen_move, chosen_take
-        return actions_to_take[action][0], actions_to_take[action][1], actions_to_take[action][2]
+        return action
     
     
     """
@@ -373,102 +951,189 @@ class MCTS_Actor(Actor):
     def backpropagate(self, outcome):
         
         # take the most recent state
-        last_board_hash = self.history.pop()
-        self.plays[last_board_hash] += 1
-        self.values[last_board_hash] = outcome
+        table_key, sign = self.table_key(self.history.pop())
+        last_slot = self.table.store(table_key)
+        self.table.plays[last_slot] += 1
+        self.table.values[last_slot] = sign * outcome
         
         # update using an average
         for hash_val in self.history: 
-            self.plays[hash_val] += 1
-            self.values[hash_val] += 1 / self.plays[hash_val] * (outcome - self.values[hash_val])       
+            table_key, sign = self.table_key(hash_val)
+            slot = self.table.store(table_key)
+            self.table.plays[slot] += 1
+            self.table.values[slot] += 1 / self.table.plays[slot] * (sign * outcome - self.table.values[slot])       
     
     
     """
-    Check if the player is going to enter any new states.
+    Return the indices of the moves which lead to states with no statistics.
     """    
-    def new_playable_states(self, possible_moves, pieces_taken, current_board, player):
-        
-        previously_visited = list()
-        new_moves = dict()
-        new_pieces_taken = dict()
-            
-        # cycle through positions with available moves
-        for key, value in possible_moves.items():
-
-            # cycle through the possible moves at that position
-            for i in range(value.shape[0]):
-
-                # create a copy of the array to avoid editing the original
-                current_board_copy = current_board.copy()
-
-                chosen_piece = key
-                chosen_move = value[i, :]
-                chosen_take = []
-
-                if key in pieces_taken:
-                    chosen_take = pieces_taken[key][i]     
-
-                # get the new state and hash it
-                new_board = update_board(player, chosen_piece, chosen_move, chosen_take, current_board_copy, self.size)   
-                new_hash = hash_board(new_board, self.size, self.hash_table)  
-                
-                # check if the hash state is in the previous plays
-                old_visit = new_hash in self.plays
-                previously_visited.append(old_visit) 
-                
-                # save the new moves
-                if not old_visit: 
-                    
-                    # if this is the first move for that piece                    
-                    if chosen_piece not in new_moves:
-                        new_moves[chosen_piece] = np.vstack([chosen_move])
-                        
-                        # if pieces were taken
-                        if len(chosen_take) > 0:                            
-                            new_pieces_taken[chosen_piece] = [chosen_take]
-                    
-                    # if this is not the first move
-                    else:
-                        
-                        # add this move to previous moves
-                        new_moves[chosen_piece] = np.vstack([new_moves[chosen_piece], chosen_move]) 
-                        
-                        # if this piece could take other pieces
-                        if chosen_piece in new_pieces_taken:    
-                            new_pieces_taken[chosen_piece] = [new_pieces_taken[chosen_piece][0], chosen_take]
-                            
-                        # if this is the only take
-                        elif len(chosen_take) > 0:
-                            new_pieces_taken[chosen_piece] = [chosen_take]
-        
-        return all(previously_visited), new_moves, new_pieces_taken
-    
-    """
-    Save the learned values as a pickle file
+    def unvisited_children(self, node):
+        return [idx for idx, new_hash in enumerate(node.child_keys) if self.table_key(new_hash)[0] not in self.table]
+    
+    
+    """
+    Return the key under which the statistics of a position are held in the
+    table and the sign of its value there, which is -1 if the position is 
+    held as its mirror image.
+    """
+    def table_key(self, hash_num):
+        if not self.symmetric:
+            return hash_num, 1
+        return canonical_hash(hash_num, self.size, self.hash_table)
+    
+    
+    """
+    Return the plays and value of a position from the table, counting 
+    in-flight visits with the virtual value if it is given.
+    """
+    def table_value(self, hash_num, virtual_value=None):
+        table_key, sign = self.table_key(hash_num)
+        if virtual_value is not None:
+            virtual_value = sign * virtual_value
+        plays, value = self.table.get(table_key, virtual_value)
+        return plays, sign * value
+    
+    
+    """
+    Save the learned statistics to a memory-mapped file, only writing 
+    the changes if the statistics were loaded from or saved to it before
     """
     def save_values(self, filename):
+        self.table.save("./values/table" + filename + ".dat")
         
-        # save values dictionary        
-        values = open("./values/values" + filename + ".pkl", "wb")
-        pickle.dump(self.values, values)
-        values.close()
-        
-        # save plays dictionary
-        plays = open("./values/plays" + filename + ".pkl", "wb")
-        pickle.dump(self.plays, plays)
-        plays.close()
+    """
+    Load the pre-trained statistics from the memory-mapped file, reading 
+    entries from disk as they are used. If writable, changes are saved 
+    back to the same file.
+    """
+    def load_values(self, filename, writable=False):
+        self.table = TranspositionTable.open("./values/table" + filename + ".dat", writable)
         
     """
-    Load the pre-trained values from the pickle file
+    Compile the learned statistics of positions with at least min_plays 
+    plays into an opening book file
     """
-    def load_values(self, filename):
+    def save_book(self, filename, min_plays=BOOK_MIN_PLAYS):
+        build_book(self.table, "./values/book" + filename + ".dat", min_plays)
         
-        # load values dictionary 
-        values = open("./values/values" + filename + ".pkl", "rb")
-        values_dict = pickle.load(values)
-        self.values = values_dict
+    """
+    Open the opening book file, which is memory-mapped rather than read
+    """
+    def load_book(self, filename):
+        self.book = OpeningBook("./values/book" + filename + ".dat")
         
-        # load plays dictionary         
-        plays = open("./values/plays" + filename + ".pkl", "rb")
-        plays_dict = pickle.load(plays)
-        self.plays = plays_dict 
\ No newline at end of file
+    """
+    Load the endgame tablebase from the numpy file
+    """
+    def load_tablebase(self, filename):
+        self.tablebase = Tablebase.load("./values/tablebase" + filename + ".npz")
+
+
+"""
+Search from the root in the pondering process until told to stop.
+"""
+def _ponder(actor, root, board_data, stop, count):
+    
+    # ensure the process does not repeat the moves of its parent
+    random.seed()
+    np.random.seed()
+    seed_kernels(np.random.randint(2**31 - 1))
+    
+    actor.ponder(root, board_data, stop, count)
+
+
+# the actor used by each worker process in a parallel search
+_worker_actor = None
+
+
+"""
+Store a copy of the actor in the worker process.
+"""
+def _init_worker(actor):
+    global _worker_actor
+    _worker_actor = actor
+    
+    # keep the changes made by the worker out of the saved file
+    actor.table.make_private()
+
+
+"""
+Seed the worker, update its settings and create the root of its search tree 
+for the input board. Returns the root with the nodes expanded and table 
+lookups and hits before the search, which worker_stats needs.
+"""
+def _worker_root(actor, input_board, seed, settings):
+    
+    # ensure the workers explore different moves
+    random.seed(int(seed))
+    np.random.seed(seed)
+    seed_kernels(seed)
+    
+    for name, value in settings.items():
+        setattr(actor, name, value)
+    
+    # collect the statistics of this search alone
+    actor.search_stats = SearchStats()
+    start_counts = (actor.nodes_expanded, actor.table.probes, actor.table.hits)
+    
+    root = Node(hash_board(input_board, actor.size, actor.hash_table, actor.player), actor.player)
+    actor.table.store(actor.table_key(root.key)[0])
+    actor.expand(root, input_board)
+    
+    return root, start_counts
+
+
+"""
+Return the statistics of the search in a worker, to be added to those
+of the search which started it.
+"""
+def _worker_stats(actor, start_counts):
+    
+    stats = actor.search_stats
+    stats.nodes_expanded = actor.nodes_expanded - start_counts[0]
+    stats.table_probes = actor.table.probes - start_counts[1]
+    stats.table_hits = actor.table.hits - start_counts[2]
+    
+    return stats
+
+
+"""
+Run simulations from the input board in a worker process and return the
+change in plays and total value of the root and each of its children, along
+with the number of simulations run and the statistics of the search.
+"""
+def _root_search(task):
+    input_board, number_sims, seed, deadline, node_budget, settings = task
+    actor = _worker_actor
+    root, start_counts = _worker_root(actor, input_board, seed, settings)
+    
+    # record the statistics before searching
+    keys = list(dict.fromkeys(actor.table_key(hash_num)[0] for hash_num in [root.key] + root.child_keys))
+    before = [actor.table.get(hash_num) for hash_num in keys]
+    
+    sims = actor.run_simulations(root, input_board, number_sims, deadline, node_budget)
+    
+    delta_plays, delta_values = list(), list()
+    for hash_num, (plays, value) in zip(keys, before):
+        new_plays, new_value = actor.table.get(hash_num)
+        delta_plays.append(new_plays - plays)
+        delta_values.append(new_value * new_plays - value * plays)
+    
+    stats = _worker_stats(actor, start_counts)
+    
+    return np.array(keys, dtype=np.uint64), np.array(delta_plays), np.array(delta_values), sims, stats
+
+
+"""
+Run simulations from the input board in a worker process, updating the
+shared statistics table in place. Returns the number of simulations run
+and the statistics of the search.
+"""
+def _tree_search(task):
+    input_board, number_sims, seed, deadline, node_budget, settings = task
+    actor = _worker_actor
+    root, start_counts = _worker_root(actor, input_board, seed, settings)
+    
+    sims = actor.run_simulations(root, input_board, number_sims, deadline, node_budget)
+    
+    return sims, _worker_stats(actor, start_counts)
@@ -6,34 +6,197 @@ Created on Tue Mar 29 20:47:04 2022
 @author: hemerson
 """
 
-import random
+import math
 import numpy as np
 
+from move_utils import move_fields, taken_squares
+
+# mask of the 64 bits of a zobrist key
+KEY_MASK = (1 << 64) - 1
+
+
 """
 Initialise the zobrist hashing function by filling a table corresponding
-to the size of the board and the number of pieces with random numbers and bit strings   
+to the size of the board and the number of pieces with random 64-bit integers.
+The extra final row holds the key toggled when it is black's turn to move.
+If symmetric, the table is built so that the hash of a position gives the
+hash of its mirror image (see mirror_hash).
 """            
-def init_zobrist(size):  
-    table = np.zeros((size * size, 5))
+def init_zobrist(size, seed=0, symmetric=False):  
+    
+    # seeded so that every agent hashes the same position to the same key
+    rng = np.random.default_rng(seed)
+    table = rng.integers(0, np.iinfo(np.uint64).max, size=(size * size + 1, 5), dtype=np.uint64, endpoint=True)
+    
+    if symmetric:
+        
+        # the key of the piece of the other colour on the rotated square is 
+        # the key with its two halves swapped, which the side key is not changed by
+        half = size * size // 2
+        table[size * size - 1:half - 1:-1] = rotate_keys(table[:half, [0, 4, 3, 2, 1]])
+        low = int(table[size * size, 0]) & 0xFFFFFFFF
+        table[size * size, 0] = low | (low << 32)
 
-    for i in range(size * size):
-        for j in range(-2, 3):
+    return table
 
-            # generate a random number
-            table[i, j] = random.randint(0, 2**1000 - 1)     
 
-    return table
+"""
+Swap the two 32-bit halves of an array of keys.
+"""
+def rotate_keys(keys):
+    return (keys << np.uint64(32)) | (keys >> np.uint64(32))
+
+
+"""
+Return the hash of the mirror image of a position, with the colours of the 
+pieces swapped, the board rotated by 180 degrees and the other player to 
+move, which is the same position for the other side. The hash table must 
+have been made with symmetric=True.
+"""
+def mirror_hash(h, size, hash_table):
+    return (((h << 32) | (h >> 32)) & KEY_MASK) ^ int(hash_table[size * size, 0])
+
+
+"""
+Return the canonical hash shared by a position and its mirror image, which 
+is the smaller of the two, and the sign which its value is multiplied by 
+to be stored under that hash (-1 if the mirror image is used).
+"""
+def canonical_hash(h, size, hash_table):
+    mirrored = mirror_hash(h, size, hash_table)
+    if mirrored < h:
+        return mirrored, -1
+    return h, 1
 
 
 """
-Create a zobrist hash for the current board set-up    
+Create a zobrist hash for the current board set-up with the given player to move   
 """
-def hash_board(current_board, size, hash_table):    
-    h = 0        
-    for i in range(size):
-        for j in range(size):             
-            if current_board[i, j] != 0:                
-                col = current_board[i, j]                      
-                h = h ^ int(hash_table[i * size + j, col])
+def hash_board(current_board, size, hash_table, player='white'):    
+    
+    # xor together the keys of every occupied square
+    squares = np.flatnonzero(current_board)
+    h = int(np.bitwise_xor.reduce(hash_table[squares, current_board.ravel()[squares]]))
+    
+    # add the side to move
+    if player == 'black':
+        h = h ^ int(hash_table[size * size, 0])
             
     return h
+
+
+"""
+Update a zobrist hash for a move by only toggling the squares which change
+and the side to move. The board is read before the move is made, so it must 
+not have been updated yet.
+"""
+def hash_move(current_hash, player, chosen_piece, chosen_move, chosen_take, current_board, size, hash_table):
+
+    piece_type = current_board[chosen_piece[0], chosen_piece[1]]
+    new_piece_type = piece_type
+
+    # check if the piece is promoted to a king
+    if player == 'white' and chosen_move[1] == size - 1:
+        new_piece_type = -2
+    elif player == 'black' and chosen_move[1] == 0:
+        new_piece_type = 2
+
+    # remove the piece from its previous location and add it at the new one
+    h = current_hash ^ int(hash_table[chosen_piece[0] * size + chosen_piece[1], piece_type])
+    h = h ^ int(hash_table[chosen_move[0] * size + chosen_move[1], new_piece_type])
+
+    # remove the taken pieces
+    for i in range(len(chosen_take)):
+        row, col = chosen_take[i][0], chosen_take[i][1]
+        h = h ^ int(hash_table[row * size + col, current_board[row, col]])
+
+    # pass the turn to the other player
+    h = h ^ int(hash_table[size * size, 0])
+
+    return h
+
+
+"""
+Estimate the outcome of the board from the material and the advancement of 
+the men, returning a value between -1 (black winning) and 1 (white winning).
+"""
+def evaluate_board(current_board, size, king_value=1.5, advance_value=0.1):
+    
+    # white men move towards the last column and black men towards the first
+    cols = np.arange(size)
+    white_advance = np.sum((current_board == -1) * cols) / (size - 1)
+    black_advance = np.sum((current_board == 1) * (size - 1 - cols)) / (size - 1)
+    
+    white = np.count_nonzero(current_board == -1) + king_value * np.count_nonzero(current_board == -2) + advance_value * white_advance
+    black = np.count_nonzero(current_board == 1) + king_value * np.count_nonzero(current_board == 2) + advance_value * black_advance
+    
+    # an advantage of two men is worth about three quarters of a win
+    return math.tanh((white - black) / 2)
+
+
+"""
+Score a move for a playout policy, rewarding captures and promotions and 
+penalising moves which leave the piece where it can be taken straight away.
+"""
+def score_move(player, chosen_piece, chosen_move, chosen_take, current_board, size):
+    
+    piece_type = current_board[chosen_piece[0], chosen_piece[1]]
+    score = len(chosen_take)
+    
+    # check if the piece is promoted to a king
+    if player == 'white' and piece_type == -1 and chosen_move[1] == size - 1: score += 1
+    elif player == 'black' and piece_type == 1 and chosen_move[1] == 0: score += 1
+    
+    # the squares emptied by the move
+    emptied = {(chosen_piece[0], chosen_piece[1])}
+    emptied.update((take[0], take[1]) for take in chosen_take)
+    
+    # the direction in which the enemy men move
+    enemy_forward = -1 if player == 'white' else 1
+    row, col = chosen_move[0], chosen_move[1]
+    
+    for d_row in (-1, 1):
+        for d_col in (-1, 1):
+            
+            # an enemy piece next to the square which can jump over it
+            enemy_row, enemy_col = row + d_row, col + d_col
+            land_row, land_col = row - d_row, col - d_col            
+            if not (0 <= enemy_row < size and 0 <= enemy_col < size and 0 <= land_row < size and 0 <= land_col < size):
+                continue
+            if (enemy_row, enemy_col) in emptied:
+                continue
+            
+            enemy_type = current_board[enemy_row, enemy_col]
+            if enemy_type * piece_type >= 0:
+                continue
+            if abs(enemy_type) == 1 and -d_col != enemy_forward:
+                continue
+            
+            if current_board[land_row, land_col] == 0 or (land_row, land_col) in emptied:
+                return score - 1
+    
+    return score
+
+
+"""
+Update a zobrist hash for a packed move, reading the board before the move
+is made.
+"""
+def hash_packed_move(current_hash, move, current_board, size, hash_table):
+
+    from_square, to_square, promotes, take_mask = move_fields(move)
+    flat = current_board.reshape(-1)
+
+    # remove the piece from its previous location and add it at the new one
+    piece_type = flat[from_square]
+    h = current_hash ^ int(hash_table[from_square, piece_type])
+    h = h ^ int(hash_table[to_square, 2 * piece_type if promotes else piece_type])
+
+    # remove the taken pieces
+    for square in taken_squares(take_mask):
+        h = h ^ int(hash_table[square, flat[square]])
+
+    # pass the turn to the other player
+    h = h ^ int(hash_table[size * size, 0])
+
+    return h
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:40:22 2026
+
+@author: hemerson
+"""
+
+"""
+Functions acting on a stack of boards with shape (N, size, size) at once.
+"""
+
+import numpy as np
+
+from move_utils import move_fields, taken_squares
+
+# the diagonal directions as (row, col) steps
+DIRECTIONS = np.array([[1, 1], [-1, 1], [1, -1], [-1, -1]])
+
+# value of the squares padding the edge of the board
+WALL = 7
+
+# fewest boards for which batch_playout plays more games per second than
+# playing them one at a time, below which the cost of each step dominates
+MIN_PLAYOUT_BATCH = 32
+
+# fewest moves for which batch_child_keys hashes the moves from a single
+# board faster than hashing them one at a time
+MIN_CHILD_KEYS_BATCH = 16
+
+
+"""
+Pad each board with two squares of wall so that every step and jump
+can be read without checking the edges.
+"""
+def pad_boards(boards):
+    return np.pad(boards, ((0, 0), (2, 2), (2, 2)), constant_values=WALL)
+
+
+"""
+Return the signs of the pieces belonging to each player,
+-1 for white and +1 for black.
+"""
+def player_signs(players, number_boards):
+    signs = np.where(np.asarray(players) == 'white', -1, 1).astype(np.int8)
+    return np.broadcast_to(signs, (number_boards,)).copy()
+
+
+"""
+Return boolean masks with shape (N, 4, size, size) of the pieces which can
+step or jump in each of the DIRECTIONS, for padded boards and the sign of
+the player to move on each board.
+"""
+def batch_move_masks(padded, signs, size):
+
+    number_boards = padded.shape[0]
+    inner = padded[:, 2:size + 2, 2:size + 2] * signs[:, None, None]
+    men, kings = inner == 1, inner == 2
+
+    # men move towards the opposing side
+    forward = -signs
+
+    steps = np.zeros((number_boards, 4, size, size), dtype=bool)
+    jumps = np.zeros((number_boards, 4, size, size), dtype=bool)
+
+    for d, (d_row, d_col) in enumerate(DIRECTIONS):
+        movers = kings | (men & (forward == d_col)[:, None, None])
+
+        # the squares one and two steps away in this direction
+        one = padded[:, 2 + d_row:size + 2 + d_row, 2 + d_col:size + 2 + d_col]
+        two = padded[:, 2 + 2 * d_row:size + 2 + 2 * d_row, 2 + 2 * d_col:size + 2 + 2 * d_col]
+        enemy = (one * signs[:, None, None] < 0) & (np.abs(one) <= 2)
+
+        steps[:, d] = movers & (one == 0)
+        jumps[:, d] = movers & enemy & (two == 0)
+
+    return steps, jumps
+
+
+"""
+Return the number of first steps or jumps available to the player to move on
+each board, with a mask of shape (N, 4, size, size) of the pieces which can
+make them in each of the DIRECTIONS. Jumps are counted instead of steps on
+boards where a jump is possible. A multiple capture is counted once for its
+first jump, so this is not the number of legal moves, but a count of zero
+means the player to move has lost.
+"""
+def batch_first_steps(boards, players, size):
+
+    number_boards = boards.shape[0]
+    steps, jumps = batch_move_masks(pad_boards(boards), player_signs(players, number_boards), size)
+
+    # ensure jump moves are prioritised if possible
+    has_jump = jumps.any(axis=(1, 2, 3))
+    masks = np.where(has_jump[:, None, None, None], jumps, steps)
+
+    return masks.sum(axis=(1, 2, 3)), masks
+
+
+"""
+Return the zobrist hash of every board with the given player(s) to move,
+matching agent_utils.hash_board.
+"""
+def batch_hash(boards, players, size, hash_table):
+
+    number_boards = boards.shape[0]
+    flat = boards.reshape(number_boards, size * size)
+
+    # xor together the keys of every occupied square
+    keys = np.where(flat != 0, hash_table[np.arange(size * size), flat], np.uint64(0))
+    keys = np.bitwise_xor.reduce(keys, axis=1)
+
+    # add the side to move
+    black = np.broadcast_to(np.asarray(players) == 'black', (number_boards,))
+    keys[black] ^= hash_table[size * size, 0]
+
+    return keys
+
+
+"""
+Split the lists of packed moves from each board into flat arrays of the
+board each move is made on, its start square, end square and promotion
+flag, and an (M, T) array of the squares taken by each move padded with -1.
+"""
+def move_arrays(moves):
+
+    owners, from_squares, to_squares, promotes, takes = list(), list(), list(), list(), list()
+    for owner, board_moves in enumerate(moves):
+        for move in board_moves:
+            from_square, to_square, promote, take_mask = move_fields(move)
+            owners.append(owner)
+            from_squares.append(from_square)
+            to_squares.append(to_square)
+            promotes.append(promote)
+            takes.append(taken_squares(take_mask))
+
+    # pad the taken squares of each move to the same length
+    take_squares = np.full((len(takes), max(map(len, takes), default=0)), -1, dtype=np.int64)
+    for i, squares in enumerate(takes):
+        take_squares[i, :len(squares)] = squares
+
+    return (np.array(owners, dtype=np.int64), np.array(from_squares, dtype=np.int64),
+            np.array(to_squares, dtype=np.int64), np.array(promotes, dtype=bool), take_squares)
+
+
+"""
+Return the boards reached by each of the packed moves from each of the
+boards, given as a list with the moves of each board, with shape
+(M, size, size). The successors of each board follow each other.
+"""
+def batch_successors(boards, moves, size):
+
+    owners, from_squares, to_squares, promotes, take_squares = move_arrays(moves)
+    index = np.arange(len(owners))
+
+    successors = boards.reshape(boards.shape[0], size * size)[owners]
+
+    # move the piece, crowning it if it reaches the far side
+    pieces = successors[index, from_squares]
+    pieces = np.where(promotes, 2 * pieces, pieces)
+
+    successors[index, from_squares] = 0
+    taken = take_squares >= 0
+    successors[np.nonzero(taken)[0], take_squares[taken]] = 0
+    successors[index, to_squares] = pieces
+
+    return successors.reshape(len(owners), size, size)
+
+
+"""
+Return the zobrist hash after each of the packed moves from each of the
+boards with the given hashes, matching agent_utils.hash_packed_move. The
+moves are given as a list with the moves of each board and the hashes of
+the successors of each board follow each other.
+"""
+def batch_child_keys(keys, boards, moves, size, hash_table):
+
+    owners, from_squares, to_squares, promotes, take_squares = move_arrays(moves)
+    flat = boards.reshape(boards.shape[0], size * size)
+
+    # remove each piece from its previous location and add it at the new one
+    pieces = flat[owners, from_squares]
+    new_pieces = np.where(promotes, 2 * pieces, pieces)
+    child_keys = np.asarray(keys, dtype=np.uint64)[owners]
+    child_keys ^= hash_table[from_squares, pieces] ^ hash_table[to_squares, new_pieces]
+
+    # remove the taken pieces, where the padding reads an empty square
+    if take_squares.shape[1] > 0:
+        taken = take_squares >= 0
+        taken_pieces = np.where(taken, flat[owners[:, None], take_squares], 0)
+        taken_keys = np.where(taken, hash_table[take_squares, taken_pieces], np.uint64(0))
+        child_keys ^= np.bitwise_xor.reduce(taken_keys, axis=1)
+
+    # pass the turn to the other player
+    child_keys ^= hash_table[size * size, 0]
+
+    return child_keys
+
+
+"""
+Play random games from every board at once until they end and return the
+outcome of each (1 if white wins, -1 if black wins and 0 for a stalemate)
+and the number of moves played in each.
+Moves are sampled uniformly from the available steps and jumps, with jumps
+taken when possible and captures continued with the same piece. Taken
+pieces are removed as they are jumped. The move limit may be given for
+each board.
+"""
+def batch_playout(boards, players, size, max_move_count=200):
+
+    number_boards = boards.shape[0]
+    padded = pad_boards(boards.astype(np.int8))
+    signs = player_signs(players, number_boards)
+
+    outcomes = np.zeros(number_boards)
+    active = np.ones(number_boards, dtype=bool)
+    move_counts = np.zeros(number_boards, dtype=int)
+
+    # the (flat) square of a piece part way through a multiple capture
+    jumping = np.full(number_boards, -1)
+
+    while True:
+
+        # stop games with too few pieces or too many moves as a stalemate
+        pieces = np.count_nonzero(padded[:, 2:size + 2, 2:size + 2], axis=(1, 2))
+        active &= (pieces >= 3) & (move_counts <= max_move_count)
+
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+
+        sub, sub_signs, sub_jumping = padded[idx], signs[idx], jumping[idx]
+        steps, jumps = batch_move_masks(sub, sub_signs, size)
+
+        # continuing captures may only use the piece which has just jumped
+        continuing = np.flatnonzero(sub_jumping >= 0)
+        if len(continuing) > 0:
+            only_piece = np.zeros((len(continuing), size * size), dtype=bool)
+            only_piece[np.arange(len(continuing)), sub_jumping[continuing]] = True
+            jumps[continuing] &= only_piece.reshape(-1, 1, size, size)
+
+        # ensure jump moves are prioritised if possible
+        has_jump = jumps.reshape(len(idx), -1).any(axis=1)
+        candidates = np.where(has_jump[:, None, None, None], jumps, steps).reshape(len(idx), -1)
+        has_move = candidates.any(axis=1)
+
+        # the player who cannot move loses
+        lost = idx[~has_move]
+        outcomes[lost] = signs[lost]
+        active[lost] = False
+
+        # randomly select a move on each board
+        scores = np.random.random_sample(candidates.shape)
+        scores[~candidates] = -1
+        choice = scores.argmax(axis=1)[has_move]
+
+        b = np.flatnonzero(has_move)
+        direction, square = np.divmod(choice, size * size)
+        row, col = np.divmod(square, size)
+        d_row, d_col = DIRECTIONS[direction, 0], DIRECTIONS[direction, 1]
+        is_jump = has_jump[b]
+        distance = np.where(is_jump, 2, 1)
+
+        # padded coordinates of the piece and the square it moves to
+        row, col = row + 2, col + 2
+        new_row, new_col = row + distance * d_row, col + distance * d_col
+
+        piece = sub[b, row, col]
+        sub[b, row, col] = 0
+        sub[b[is_jump], (row + d_row)[is_jump], (col + d_col)[is_jump]] = 0
+
+        # now king?
+        king_col = np.where(sub_signs[b] < 0, size + 1, 2)
+        promoted = (np.abs(piece) == 1) & (new_col == king_col)
+        piece = np.where(promoted, 2 * sub_signs[b], piece)
+        sub[b, new_row, new_col] = piece
+
+        # check if the piece can carry on capturing
+        can_continue = np.zeros(len(b), dtype=bool)
+        for d_row_next, d_col_next in DIRECTIONS:
+            one = sub[b, new_row + d_row_next, new_col + d_col_next]
+            two = sub[b, new_row + 2 * d_row_next, new_col + 2 * d_col_next]
+            mover = (np.abs(piece) == 2) | (-sub_signs[b] == d_col_next)
+            enemy = (one * sub_signs[b] < 0) & (np.abs(one) <= 2)
+            can_continue |= mover & enemy & (two == 0)
+        can_continue &= is_jump & ~promoted
+
+        sub_jumping[:] = -1
+        sub_jumping[b[can_continue]] = ((new_row - 2) * size + new_col - 2)[can_continue]
+
+        # update the current player when the move is over
+        finished = b[~can_continue]
+        sub_signs[finished] *= -1
+        move_counts[idx[finished]] += 1
+
+        padded[idx], signs[idx], jumping[idx] = sub, sub_signs, sub_jumping
+
+    return outcomes, move_counts
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:47:05 2026
+
+@author: hemerson
+"""
+
+"""
+Benchmarks for move generation, board updates, hashing, playouts and search.
+
+The positions are generated from fixed seeds so every run measures the same
+corpus. The results are printed and can be written as JSON and compared with
+the results of an earlier run:
+
+    python benchmark.py --output results.json
+    python benchmark.py --compare results.json
+"""
+
+import argparse, json, os, platform, random, subprocess, time
+import numpy as np
+
+from board import Board
+from board_utils import MOVE_GENERATORS, PACKED_MOVE_GENERATORS, update_board
+from agent_utils import hash_board, hash_packed_move, init_zobrist
+from move_utils import make_move, unmake_move, move_fields, taken_squares
+from batch_utils import batch_playout, batch_hash, batch_child_keys, batch_first_steps
+from kernels import random_playout, seed_kernels, NUMBA_AVAILABLE
+from agent import MCTS_Actor
+
+
+"""
+Play random moves from the starting position and return the board after the
+given number of moves with the player to move, or None if the game ended.
+"""
+def random_position(size, number_moves, rng):
+
+    board = Board(size=size)
+    player = 'white'
+
+    for _ in range(number_moves):
+        possible_moves, pieces_taken = board.get_moves(player)
+        if len(pieces_taken) > 0:
+            possible_moves = {coords: possible_moves[coords] for coords in pieces_taken}
+        if len(possible_moves) == 0:
+            return None
+
+        # randomly select a piece and then a move for that piece
+        chosen_piece = rng.choice(sorted(possible_moves))
+        chosen_index = rng.randrange(possible_moves[chosen_piece].shape[0])
+        chosen_take = pieces_taken[chosen_piece][chosen_index] if len(pieces_taken) > 0 else []
+        board.update(player, chosen_piece, possible_moves[chosen_piece][chosen_index], chosen_take)
+
+        if player == 'white': player = 'black'
+        else: player = 'white'
+
+    return board.data.copy(), player
+
+
+"""
+Return a board with the given number of pieces placed at random on the
+playable squares, with the given fraction of them kings.
+"""
+def random_placement(size, number_pieces, king_fraction, rng):
+
+    squares = [(row, col) for row in range(size) for col in range(size) if (row + col) % 2 == 0]
+    data = np.zeros((size, size), dtype=int)
+
+    for i, (row, col) in enumerate(rng.sample(squares, number_pieces)):
+        sign = -1 if i % 2 == 0 else 1
+        is_king = rng.random() < king_fraction
+
+        # men are promoted on reaching the far side
+        if (sign == -1 and col == size - 1) or (sign == 1 and col == 0):
+            is_king = True
+
+        data[row, col] = sign * (2 if is_king else 1)
+
+    return data
+
+
+"""
+Check that a position exists and the player to move has a move.
+"""
+def playable(position, size):
+    return position is not None and len(PACKED_MOVE_GENERATORS['bitboard'](position[1], position[0], size)) > 0
+
+
+"""
+Build the corpus of positions as a dictionary of lists of (board, player)
+for the opening, the midgame, king-heavy positions and endgames where a
+multiple capture is available.
+"""
+def build_corpus(size=8, positions=20, seed=0):
+
+    rng = random.Random(seed)
+    corpus = {'opening': [], 'midgame': [], 'kings': [], 'multi_jump': []}
+
+    while len(corpus['opening']) < positions:
+        position = random_position(size, rng.randrange(0, 8), rng)
+        if playable(position, size): corpus['opening'].append(position)
+
+    while len(corpus['midgame']) < positions:
+        position = random_position(size, rng.randrange(16, 32), rng)
+        if playable(position, size) and np.count_nonzero(position[0]) >= size: corpus['midgame'].append(position)
+
+    while len(corpus['kings']) < positions:
+        position = (random_placement(size, rng.randrange(6, 12), 0.8, rng), rng.choice(['white', 'black']))
+        if playable(position, size): corpus['kings'].append(position)
+
+    # keep endgames where the player to move can take two or more pieces
+    move_generator = PACKED_MOVE_GENERATORS['bitboard']
+    while len(corpus['multi_jump']) < positions:
+        data = random_placement(size, rng.randrange(5, 10), 0.3, rng)
+        player = rng.choice(['white', 'black'])
+        if any(len(taken_squares(move_fields(move)[3])) >= 2 for move in move_generator(player, data, size)):
+            corpus['multi_jump'].append((data, player))
+
+    return corpus
+
+
+"""
+Call the function on every item of the inputs repeatedly for at least
+min_time seconds and return the number of calls per second. The first item
+is run once beforehand so that compiling kernels is not timed.
+"""
+def calls_per_second(function, inputs, min_time):
+
+    function(*inputs[0])
+
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for item in inputs:
+            function(*item)
+        calls += len(inputs)
+
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls / elapsed
+
+
+"""
+Return every legal (player, piece, move, taken, board) of the positions
+in the format used by update_board.
+"""
+def corpus_moves(positions, size):
+
+    moves = list()
+    for data, player in positions:
+        possible_moves, pieces_taken = MOVE_GENERATORS['bitboard'](player, data, size)
+        if len(pieces_taken) > 0:
+            possible_moves = {coords: possible_moves[coords] for coords in pieces_taken}
+
+        for chosen_piece, piece_moves in possible_moves.items():
+            for i in range(piece_moves.shape[0]):
+                chosen_take = pieces_taken[chosen_piece][i] if len(pieces_taken) > 0 else []
+                moves.append((player, chosen_piece, piece_moves[i], chosen_take, data))
+
+    return moves
+
+
+"""
+Run the benchmarks on the corpus and return the results as a dictionary.
+"""
+def run_benchmarks(corpus, size=8, min_time=1.0, number_sims=50, search_positions=10, seed=0):
+
+    results = {'numba': NUMBA_AVAILABLE}
+    positions = [position for category in corpus.values() for position in category]
+    hash_table = init_zobrist(size)
+
+    # MOVE GENERATION: ------------------------------------------------------------
+    for backend, generator in MOVE_GENERATORS.items():
+        for category, category_positions in corpus.items():
+            inputs = [(player, data, size) for data, player in category_positions]
+            results['get_moves/{}/{}'.format(backend, category)] = calls_per_second(generator, inputs, min_time)
+
+    for backend, generator in PACKED_MOVE_GENERATORS.items():
+        inputs = [(player, data, size) for data, player in positions]
+        results['get_packed_moves/{}'.format(backend)] = calls_per_second(generator, inputs, min_time)
+
+    # BOARD UPDATES: --------------------------------------------------------------
+    moves = corpus_moves(positions, size)
+    results['update_board'] = calls_per_second(
+        lambda player, piece, move, take, data: update_board(player, piece, move, take, data.copy(), size), moves, min_time)
+
+    packed = [(move, data) for data, player in positions for move in PACKED_MOVE_GENERATORS['bitboard'](player, data, size)]
+    results['make_unmake_move'] = calls_per_second(
+        lambda move, data: unmake_move(move, make_move(move, data, size), data, size), packed, min_time)
+
+    # HASHING: --------------------------------------------------------------------
+    inputs = [(data, size, hash_table, player) for data, player in positions]
+    results['hash_board'] = calls_per_second(hash_board, inputs, min_time)
+    
+    # the batched functions handle every position of the corpus in one call
+    boards = np.stack([data for data, _ in positions])
+    players = np.array([player for _, player in positions])
+    results['hash_board/batch'] = calls_per_second(lambda: batch_hash(boards, players, size, hash_table), [()], min_time) * len(positions)
+    
+    keys = [hash_board(data, size, hash_table, player) for data, player in positions]
+    moves = [PACKED_MOVE_GENERATORS['bitboard'](player, data, size) for data, player in positions]
+    inputs = [(key, data, position_moves) for key, (data, _), position_moves in zip(keys, positions, moves)]
+    results['child_keys'] = calls_per_second(
+        lambda key, data, position_moves: [hash_packed_move(key, move, data, size, hash_table) for move in position_moves], inputs, min_time)
+    results['child_keys/batch'] = calls_per_second(lambda: batch_child_keys(keys, boards, moves, size, hash_table), [()], min_time) * len(positions)
+    results['first_steps/batch'] = calls_per_second(lambda: batch_first_steps(boards, players, size), [()], min_time) * len(positions)
+
+    # PLAYOUTS: -------------------------------------------------------------------
+    np.random.seed(seed)
+    seed_kernels(seed)
+    inputs = [(data, player, size) for data, player in positions]
+    results['playout/kernel'] = calls_per_second(random_playout, inputs, min_time)
+
+    results['playout/batch'] = calls_per_second(lambda: batch_playout(boards, players, size), [()], min_time) * len(positions)
+
+    # SEARCH: ---------------------------------------------------------------------
+    for policy in ('light', 'kernel'):
+        random.seed(seed)
+        np.random.seed(seed)
+        seed_kernels(seed)
+
+        latencies, sims = list(), 0
+        for data, player in positions[::max(len(positions) // search_positions, 1)][:search_positions]:
+            agent = MCTS_Actor(player, size, backend='bitboard', memory_mb=8)
+            agent.number_sims = number_sims
+            agent.playout_policy = policy
+
+            possible_moves, pieces_taken = MOVE_GENERATORS['bitboard'](player, data, size)
+            start = time.perf_counter()
+            agent.select_action(possible_moves, pieces_taken, data)
+            latencies.append(time.perf_counter() - start)
+            sims += agent.sims_completed
+
+        for percentile in (50, 90, 99):
+            results['select_action/{}/p{}_ms'.format(policy, percentile)] = float(np.percentile(latencies, percentile)) * 1000
+        results['simulations_per_second/{}'.format(policy)] = sims / sum(latencies)
+
+    return results
+
+
+"""
+Return the current commit of the repository, if it can be found.
+"""
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+"""
+Print the results, with the ratio to an earlier run for each result if given.
+"""
+def print_results(results, previous=None):
+    for name, value in results.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            print('{:45s} {}'.format(name, value))
+            continue
+
+        line = '{:45s} {:14.2f}'.format(name, value)
+        if previous is not None and isinstance(previous.get(name), (int, float)) and previous[name] > 0:
+            line += '   x{:.2f}'.format(value / previous[name])
+        print(line)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark move generation, hashing and search.')
+    parser.add_argument('--size', type=int, default=8)
+    parser.add_argument('--positions', type=int, default=20, help='positions in each category of the corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds spent on each benchmark')
+    parser.add_argument('--sims', type=int, default=50, help='simulations for each select_action')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare with the results in this JSON file')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size, args.positions, args.seed)
+    results = run_benchmarks(corpus, args.size, args.min_time, args.sims, seed=args.seed)
+
+    previous = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+
+    print_results(results, previous)
+
+    if args.output is not None:
+        report = {
+            'commit': current_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'settings': vars(args),
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
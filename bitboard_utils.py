@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 10:12:31 2026
+
+@author: hemerson
+"""
+
+"""
+Bitboard move generation.
+
+Each board is described by four integer masks (black men, black kings,
+white men, white kings) where bit (row * size + col) is set when the
+square is occupied by that piece type. Moves are found by shifting and
+masking these integers instead of searching through coordinate lists.
+"""
+
+import numpy as np
+
+from move_utils import pack_move
+
+# cache of the direction masks for each board size
+_mask_cache = dict()
+
+
+"""
+Build the masks of squares which can legally step or jump in each
+direction for a given board size and cache them for later calls.
+"""
+def get_direction_masks(size):
+
+    if size in _mask_cache:
+        return _mask_cache[size]
+
+    step_masks = dict()
+    jump_masks = dict()
+
+    for d_row in (-1, 1):
+        for d_col in (-1, 1):
+
+            step_mask, jump_mask = 0, 0
+            for row in range(size):
+                for col in range(size):
+                    bit = 1 << (row * size + col)
+
+                    # the target square must remain on the board
+                    if 0 <= row + d_row < size and 0 <= col + d_col < size:
+                        step_mask |= bit
+
+                    # the landing square must remain on the board
+                    if 0 <= row + 2 * d_row < size and 0 <= col + 2 * d_col < size:
+                        jump_mask |= bit
+
+            step_masks[(d_row, d_col)] = step_mask
+            jump_masks[(d_row, d_col)] = jump_mask
+
+    _mask_cache[size] = (step_masks, jump_masks)
+
+    return step_masks, jump_masks
+
+
+"""
+Convert the board array into the bitboards for black men, black kings,
+white men and white kings.
+"""
+def board_to_bitboards(data, size):
+
+    flat = data.ravel()
+    bitboards = list()
+
+    for piece_type in (1, 2, -1, -2):
+        mask = 0
+        for idx in np.flatnonzero(flat == piece_type):
+            mask |= 1 << int(idx)
+        bitboards.append(mask)
+
+    return tuple(bitboards)
+
+
+"""
+Shift a mask by a (possibly negative) number of squares.
+"""
+def shift(mask, offset):
+    if offset >= 0:
+        return mask << offset
+    return mask >> -offset
+
+
+"""
+Iterate over the indices of the set bits in ascending order.
+"""
+def iterate_bits(mask):
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+"""
+Find the jump sequences available to a single piece using a depth first
+search. Only the sequences which cannot be extended any further are returned
+as a list of (landing square, taken squares) pairs, in the same order as
+board_utils.get_moves.
+"""
+def _jump_sequences(start, directions, enemy, empty, size, jump_masks, is_king):
+
+    # a king may land back on the square it started from
+    if is_king:
+        empty = empty | (1 << start)
+
+    sequences = list()
+    stack = [(start, 0, ())]
+
+    while stack:
+        square, taken, sequence = stack.pop()
+        extended = False
+
+        # push the jumps in reverse so they are searched in the order of the directions
+        for direction in reversed(directions):
+            if not (jump_masks[direction] >> square) & 1:
+                continue
+
+            offset = direction[0] * size + direction[1]
+            jumped, landing = square + offset, square + 2 * offset
+
+            # jump onto an empty square over an enemy piece not already taken
+            if (enemy >> jumped) & 1 and (empty >> landing) & 1 and not (taken >> jumped) & 1:
+                stack.append((landing, taken | (1 << jumped), sequence + (jumped,)))
+                extended = True
+
+        # the end of a sequence
+        if not extended and len(sequence) > 0:
+            sequences.append((square, sequence))
+
+    return sequences
+
+
+"""
+Return all the possible moves for a given player based on the board
+configuration using bitboards. The output matches board_utils.get_moves.
+"""
+def get_moves_bitboard(player, data, size):
+    possible_moves = dict()
+    possible_pieces_taken = dict()
+
+    b_men, b_kings, w_men, w_kings = board_to_bitboards(data, size)
+    step_masks, jump_masks = get_direction_masks(size)
+    empty = ((1 << (size * size)) - 1) & ~(b_men | b_kings | w_men | w_kings)
+
+    # Check the player colour
+    if player == 'white':
+        own_men, own_kings, enemy = w_men, w_kings, b_men | b_kings
+        forward = +1
+    elif player == 'black':
+        own_men, own_kings, enemy = b_men, b_kings, w_men | w_kings
+        forward = -1
+
+    men_directions = ((1, forward), (-1, forward))
+    king_directions = ((1, forward), (-1, forward), (1, -forward), (-1, -forward))
+
+    # find every piece with a jump available in a single pass
+    men_jumpers, king_jumpers = 0, 0
+    for direction in king_directions:
+        offset = direction[0] * size + direction[1]
+        can_jump = jump_masks[direction] & shift(enemy, -offset) & shift(empty, -2 * offset)
+        if direction in men_directions:
+            men_jumpers |= own_men & can_jump
+        king_jumpers |= own_kings & can_jump
+
+    for pieces, jumpers, directions, is_king in ((own_men, men_jumpers, men_directions, False),
+                                                 (own_kings, king_jumpers, king_directions, True)):
+        for square in iterate_bits(pieces):
+            coord = divmod(square, size)
+
+            # calculate jump moves --------------------------
+            if (jumpers >> square) & 1:
+                sequences = _jump_sequences(square, directions, enemy, empty, size, jump_masks, is_king)
+
+                possible_moves[coord] = np.array([divmod(landing, size) for landing, _ in sequences])
+                possible_pieces_taken[coord] = [np.array([divmod(jumped, size) for jumped in taken]) for _, taken in sequences]
+                continue
+
+            # calculate simple moves --------------------------
+            moves = list()
+            for direction in directions:
+                offset = direction[0] * size + direction[1]
+                if (step_masks[direction] >> square) & 1 and (empty >> (square + offset)) & 1:
+                    moves.append(divmod(square + offset, size))
+
+            if len(moves) > 0:
+                possible_moves[coord] = np.array(moves)
+
+    return possible_moves, possible_pieces_taken
+
+
+"""
+Return the legal moves for a given player as a list of packed moves, in the 
+same order as pack_moves applied to get_moves. If any jumps are available 
+only the jumps are returned.
+"""
+def get_packed_moves_bitboard(player, data, size):
+    packed_moves = list()
+
+    b_men, b_kings, w_men, w_kings = board_to_bitboards(data, size)
+    step_masks, jump_masks = get_direction_masks(size)
+    empty = ((1 << (size * size)) - 1) & ~(b_men | b_kings | w_men | w_kings)
+
+    # Check the player colour
+    if player == 'white':
+        own_men, own_kings, enemy = w_men, w_kings, b_men | b_kings
+        forward, king_col = +1, size - 1
+    elif player == 'black':
+        own_men, own_kings, enemy = b_men, b_kings, w_men | w_kings
+        forward, king_col = -1, 0
+
+    men_directions = ((1, forward), (-1, forward))
+    king_directions = ((1, forward), (-1, forward), (1, -forward), (-1, -forward))
+
+    # find every piece with a jump available in a single pass
+    men_jumpers, king_jumpers = 0, 0
+    for direction in king_directions:
+        offset = direction[0] * size + direction[1]
+        can_jump = jump_masks[direction] & shift(enemy, -offset) & shift(empty, -2 * offset)
+        if direction in men_directions:
+            men_jumpers |= own_men & can_jump
+        king_jumpers |= own_kings & can_jump
+
+    # calculate jump moves --------------------------
+    if men_jumpers | king_jumpers:
+        for jumpers, directions, is_king in ((men_jumpers, men_directions, False),
+                                             (king_jumpers, king_directions, True)):
+            for square in iterate_bits(jumpers):
+                for landing, taken in _jump_sequences(square, directions, enemy, empty, size, jump_masks, is_king):
+                    take_mask = 0
+                    for jumped in taken:
+                        take_mask |= 1 << jumped
+                    packed_moves.append(pack_move(square, landing, take_mask, not is_king and landing % size == king_col))
+        return packed_moves
+
+    # calculate simple moves --------------------------
+    for pieces, directions, is_king in ((own_men, men_directions, False),
+                                        (own_kings, king_directions, True)):
+        for square in iterate_bits(pieces):
+            for direction in directions:
+                offset = direction[0] * size + direction[1]
+                if (step_masks[direction] >> square) & 1 and (empty >> (square + offset)) & 1:
+                    landing = square + offset
+                    packed_moves.append(pack_move(square, landing, 0, not is_king and landing % size == king_col))
+
+    return packed_moves
@@ -15,17 +15,19 @@ import os
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 import pygame
 
-from board_utils import get_moves, update_board
+from board_utils import get_move_generator, update_board
+from agent_utils import hash_board, hash_move
 
 
 """
 Defines the checkers game board.
 """
 class Board: 
-    def __init__(self, size=8):
+    def __init__(self, size=8, backend='numpy', hash_table=None):
         
         # BOARD STRUCTURE
         self.size = size  
+        self.move_generator = get_move_generator(backend)
         self.data = np.zeros((self.size, self.size), dtype=int)
         number_rows_of_players = (self.size - 2)/2
         number_players_per_row = self.size/2
@@ -42,6 +44,13 @@ class Board:
                 else:
                     self.data[2*j + 1, i] = -1
                     self.data[2*j, self.size  - (i + 1)] = +1
+        
+        # HASHING
+        # when a zobrist table is given the board keeps its hash up to date
+        self.hash_table = None
+        self.key = None
+        if hash_table is not None:
+            self.set_hash_table(hash_table)
                         
         # BOARD PIECES
         # black pieces, black king = 1, 2
@@ -68,12 +77,22 @@ class Board:
     return the possible moves for the given player.
     """
     def get_moves(self, player):        
-        return get_moves(player, self.data, self.size)           
+        return self.move_generator(player, self.data, self.size)           
+       
+    """
+    hash the board with the given zobrist table and player to move 
+    and keep the hash up to date as moves are made.
+    """
+    def set_hash_table(self, hash_table, player='white'):
+        self.hash_table = hash_table
+        self.key = hash_board(self.data, self.size, self.hash_table, player)
        
     """
     update the positions of the pieces.      
     """
-    def update(self, player, chosen_piece, chosen_move, chosen_take):             
+    def update(self, player, chosen_piece, chosen_move, chosen_take):     
+        if self.hash_table is not None:
+            self.key = hash_move(self.key, player, chosen_piece, chosen_move, chosen_take, self.data, self.size, self.hash_table)        
         self.data = update_board(player, chosen_piece, chosen_move, chosen_take, self.data, self.size)               
     
     """
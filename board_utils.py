@@ -8,6 +8,88 @@ Created on Tue Mar 29 18:41:45 2022
 
 import numpy as np
 
+from bitboard_utils import get_moves_bitboard, get_packed_moves_bitboard
+from move_utils import pack_moves
+from kernels import get_packed_moves_kernel
+
+# cache of the move tables for each board size
+_table_cache = dict()
+
+
+"""
+Build the tables of moves from each square for a given board size and cache 
+them for later calls. For each player the tables for men and kings give, at
+[row][col], the list of step targets and the list of (jumped square, landing 
+square) pairs which stay on the board.
+"""
+def get_move_tables(size):
+    
+    if size in _table_cache:
+        return _table_cache[size]
+    
+    tables = dict()
+    for player, forward in (('white', +1), ('black', -1)):
+        
+        # men move forward and kings also move backward
+        men_directions = ((1, forward), (-1, forward))
+        king_directions = ((1, forward), (-1, forward), (1, -forward), (-1, -forward))
+        
+        player_tables = list()
+        for directions in (men_directions, king_directions):
+            
+            table = [[None] * size for _ in range(size)]
+            for row in range(size):
+                for col in range(size):
+                    steps, jumps = list(), list()
+                    
+                    for d_row, d_col in directions:
+                        if 0 <= row + d_row < size and 0 <= col + d_col < size:
+                            steps.append((row + d_row, col + d_col))
+                        if 0 <= row + 2 * d_row < size and 0 <= col + 2 * d_col < size:
+                            jumps.append(((row + d_row, col + d_col), (row + 2 * d_row, col + 2 * d_col)))
+                            
+                    table[row][col] = (steps, jumps)
+            player_tables.append(table)
+            
+        tables[player] = tuple(player_tables)
+        
+    _table_cache[size] = tables
+    
+    return tables
+
+
+"""
+Find the jump sequences of the piece at (row, col) with a depth first search 
+of the move table, for men and kings alike. Only the sequences which cannot
+be extended any further are returned, as a list of (landing square, taken 
+squares) pairs.
+"""
+def _capture_sequences(table, cells, row, col, enemy_sign, is_king):
+    
+    sequences = list()
+    stack = [((row, col), ())]
+    
+    while stack:
+        (path_row, path_col), taken = stack.pop()
+        extended = False
+        
+        # push the jumps in reverse so they are searched in the order of the table
+        for (jump_row, jump_col), (land_row, land_col) in reversed(table[path_row][path_col][1]):
+            
+            # if the move is onto an empty space (a king may return to where it 
+            # started) and the jump is over an enemy piece not already taken
+            empty = cells[land_row][land_col] == 0 or (is_king and land_row == row and land_col == col)
+            if empty and cells[jump_row][jump_col] * enemy_sign > 0 and (jump_row, jump_col) not in taken:
+                stack.append(((land_row, land_col), taken + ((jump_row, jump_col),)))
+                extended = True
+        
+        # the end of a sequence
+        if not extended and len(taken) > 0:
+            sequences.append(((path_row, path_col), taken))
+            
+    return sequences
+
+
 """
 Return all the possible moves for a given player based 
 on the board configuration.
@@ -15,374 +97,34 @@ on the board configuration.
 def get_moves(player, data, size):
     possible_moves = dict()
     possible_pieces_taken = dict()
-
-    # initialise the pieces 
-    w_piece_locations = np.argwhere(data == -1)
-    w_king_locations = np.argwhere(data == -2)
-    b_piece_locations = np.argwhere(data == 1)
-    b_king_locations = np.argwhere(data == 2)
-    empty_spaces = np.argwhere(data == 0)
-    player_piece_locations = None
-    player_king_locations = None
-    enemy_piece_locations = None
-    forward = None        
+    
+    # look up the squares on a list of lists rather than the array
+    cells = data.tolist()
+    men_table, king_table = get_move_tables(size)[player]
 
     # Check the player colour  
     if player == 'white':
-        player_piece_locations = w_piece_locations
-        player_king_locations = w_king_locations
-        enemy_piece_locations = np.concatenate([b_piece_locations, b_king_locations])  
-        forward = +1
+        man_type, king_type, enemy_sign = -1, -2, 1
     elif player == 'black':
-        player_piece_locations = b_piece_locations
-        player_king_locations = b_king_locations
-        enemy_piece_locations = np.concatenate([w_piece_locations, w_king_locations])   
-        forward = -1 
-
-    # for regular pieces --------------------------
-    for coord in player_piece_locations:
-
-        moves = np.empty((0, 2), dtype=np.int)
-
-        # set starting coordinates                
-        row, col = coord[0], coord[1]
-
-        # calculate simple moves --------------------------
-
-        # move down
-        if row + 1 != size:
-            move = np.array([[row + 1, col + forward]])
-
-            if np.any((empty_spaces == move[0]).all(axis=1)):
-                moves = np.append(moves, move, axis=0)
-
-        # move up
-        if row - 1 != -1:
-            move = np.array([[row - 1, col + forward]])
-
-            if np.any((empty_spaces == move[0]).all(axis=1)):
-                moves = np.append(moves, move, axis=0)
-
-        # calculate jump moves --------------------------
-
-        jumps = [np.expand_dims(coord, axis=0)]
-        pieces_taken = list()
-
-        prev_jump = 0
-        current_jump = 1
-
-        taken_count = 0
-
-        while True:
-
-            # number of new jumps in last cycle                    
-            new_jumps =  current_jump - prev_jump
-
-            # number of total jumps excluding those added last cycle
-            prev_jump_copy = prev_jump  
-
-            # update the counts
-            prev_jump = current_jump
-            taken_count_copy = taken_count
-
-            for j in range(new_jumps):
-
-                # get the new jump coordinate from the last cycle
-                new_jump_coord = jumps[prev_jump_copy + j]
-
-                row, col = new_jump_coord[-1, 0], new_jump_coord[-1, 1]
-
-                # jump down
-                if row + 2 <= size:
-                    move = np.array([[row + 2, col + (2 * forward)]])
-                    jump_piece = np.array([[row + 1, col + forward]])
-
-                    # if the move is onto an empty space and the jump is over an enemy piece
-                    if np.any((empty_spaces == move[0]).all(axis=1)) and np.any((enemy_piece_locations == jump_piece[0]).all(axis=1)):                                  
-
-                        # add new jump to path
-                        jump_path = np.append(new_jump_coord, move,  axis=0)
-                        jumps.append(jump_path)      
-
-                        # if there is already a jump in the path append to it
-                        if taken_count_copy > 0:                                    
-                            jump_piece = np.append(pieces_taken[prev_jump_copy + j - 1], jump_piece, axis=0)
-
-                        # update the taken pieces and jumps
-                        pieces_taken.append(jump_piece)
-                        current_jump += 1
-                        taken_count += 1
-
-                # jump up
-                if row - 2 >= 0:
-                    move = np.array([[row - 2, col + (2 * forward)]])
-                    jump_piece = np.array([[row - 1, col + forward]])
-
-                    # if the move is onto an empty space and the jump is over an enemy piece
-                    if np.any((empty_spaces == move[0]).all(axis=1)) and np.any((enemy_piece_locations == jump_piece[0]).all(axis=1)):                                  
-
-                        # add new jump to path
-                        jump_path = np.append(new_jump_coord, move,  axis=0)
-                        jumps.append(jump_path)      
-
-                        # if there is already a jump in the path append to it
-                        if taken_count_copy > 0:                                    
-                            jump_piece = np.append(pieces_taken[prev_jump_copy + j - 1], jump_piece, axis=0)
-
-                        # update the taken pieces and jumps
-                        pieces_taken.append(jump_piece)
-                        current_jump += 1
-                        taken_count += 1                              
-
-            if current_jump == prev_jump:
-                break
-
-        # return the moves for all normal pieces
-
-        # if there were any jump moves
-        if len(jumps) > 1:
-
-            cleaned_jumps = list()
-            cleaned_takes = list()
-
-            for i in range(1, len(jumps)):  
-
-                intermediate = False
-
-                # check if this is an intermediate step
-                for j in range(i + 1, len(jumps)):                             
-                    if np.array_equal(jumps[i], jumps[j][:-1, :]): 
-                        intermediate = True
-
-                # if its not an intermediate step add it to the clean jumps
-                if not intermediate:                             
-                    cleaned_jump = jumps[i][-1, :]
-                    cleaned_jumps.append(cleaned_jump)
-
-                    cleaned_take = pieces_taken[i - 1]
-                    cleaned_takes.append(cleaned_take)
-
-            possible_moves[(coord[0], coord[1])] = np.array(cleaned_jumps)
-            possible_pieces_taken[(coord[0], coord[1])] = cleaned_takes
-
-        else:
-            # if there were any normal moves
-            if moves.shape[0] > 0:                    
-                possible_moves[(coord[0], coord[1])] = moves
-
-
-    # for king pieces --------------------------
-    for coord in player_king_locations:
-
-        moves = np.empty((0, 2), dtype=np.int)
-
-        # set starting coordinates   
-        row, col = coord[0], coord[1]
-
-        # calculate simple moves --------------------------
-
-        # move down + forward
-        if row + 1 != size:
-            move = np.array([[row + 1, col + forward]])
-
-            if np.any((empty_spaces == move[0]).all(axis=1)):
-                moves = np.append(moves, move, axis=0)
-
-        # move up + forward
-        if row - 1 != -1:
-            move = np.array([[row - 1, col + forward]])
-
-            if np.any((empty_spaces == move[0]).all(axis=1)):                
-                moves = np.append(moves, move, axis=0)                        
-
-        # move down + backward
-        if col + forward != size:
-            move = np.array([[row + 1, col - forward]])
-
-            if np.any((empty_spaces == move[0]).all(axis=1)):                
-                moves = np.append(moves, move, axis=0)
-
-        # move up + backward
-        if col - forward != -1:
-            move = np.array([[row - 1, col - forward]])
-
-            if np.any((empty_spaces == move[0]).all(axis=1)):
-                moves = np.append(moves, move, axis=0)
-
-        # calculate jump moves --------------------------
-
-        jumps = [np.expand_dims(coord, axis=0)]
-        pieces_taken = list()
-
-        prev_jump = 0
-        current_jump = 1                
-        taken_count = 0
-
-        while True:
-
-            # number of new jumps in last cycle                    
-            new_jumps =  current_jump - prev_jump
-
-            # number of total jumps excluding those added last cycle
-            prev_jump_copy = prev_jump  
-
-            # update the counts
-            prev_jump = current_jump                    
-            taken_count_copy = taken_count
-
-            for j in range(new_jumps):                          
-
-                # get the new jump coordinate from the last cycle
-                new_jump_coord = jumps[prev_jump_copy + j]                        
-                row, col = new_jump_coord[-1, 0], new_jump_coord[-1, 1]
-
-                # jump down + forward
-                if row + 2 <= size:
-                    move = np.array([[row + 2, col + (2 * forward)]])
-                    jump_piece = np.array([[row + 1, col + forward]])
-
-                    # if the move is onto an empty space and the jump is over an enemy piece
-                    if (np.any((empty_spaces == move[0]).all(axis=1)) or np.array_equal(coord, move[0])) and np.any((enemy_piece_locations == jump_piece[0]).all(axis=1)):        
-
-                        # check if this jump is over the piece previously jumped
-                        condition = False
-                        if taken_count_copy > 0:
-                            condition = np.any((pieces_taken[prev_jump_copy + j - 1] == jump_piece[0]).all(axis=1))
-
-                        if not condition:
-
-                            # add new jump to path
-                            jump_path = np.append(new_jump_coord, move,  axis=0)
-                            jumps.append(jump_path)      
-
-                            # if there is already a jump in the path append to it  
-                            if taken_count_copy > 0:                                     
-                                jump_piece = np.append(pieces_taken[prev_jump_copy + j - 1], jump_piece, axis=0)
-
-                            # update the taken pieces and jumps
-                            pieces_taken.append(jump_piece)
-                            current_jump += 1
-                            taken_count += 1
-
-                # jump up + forward
-                if row - 2 >= 0:
-                    move = np.array([[row - 2, col + (2 * forward)]])
-                    jump_piece = np.array([[row - 1, col + forward]])
-
-                    # if the move is onto an empty space and the jump is over an enemy piece
-                    if (np.any((empty_spaces == move[0]).all(axis=1)) or np.array_equal(coord, move[0])) and np.any((enemy_piece_locations == jump_piece[0]).all(axis=1)):        
-
-                        # check if this jump is over the piece previously jumped
-                        condition = False
-                        if taken_count_copy > 0:
-                            condition = np.any((pieces_taken[prev_jump_copy + j - 1] == jump_piece[0]).all(axis=1))
-
-                        if not condition:
-
-                            # add new jump to path
-                            jump_path = np.append(new_jump_coord, move,  axis=0)
-                            jumps.append(jump_path)      
-
-                            # if there is already a jump in the path append to it  
-                            if taken_count_copy > 0:                                     
-                                jump_piece = np.append(pieces_taken[prev_jump_copy + j - 1], jump_piece, axis=0)
-
-                            # update the taken pieces and jumps
-                            pieces_taken.append(jump_piece)
-                            current_jump += 1
-                            taken_count += 1                         
-
-                # jump down + backward
-                if row + 2 <= size:
-                    move = np.array([[row + 2, col - (2 * forward)]])
-                    jump_piece = np.array([[row + 1, col - forward]])
-
-                    # if the move is onto an empty space and the jump is over an enemy piece
-                    if (np.any((empty_spaces == move[0]).all(axis=1)) or np.array_equal(coord, move[0])) and np.any((enemy_piece_locations == jump_piece[0]).all(axis=1)):        
-
-                        # check if this jump is over the piece previously jumped
-                        condition = False
-                        if taken_count_copy > 0:
-                            condition = np.any((pieces_taken[prev_jump_copy + j - 1] == jump_piece[0]).all(axis=1))
-
-                        if not condition:
-
-                            # add new jump to path
-                            jump_path = np.append(new_jump_coord, move,  axis=0)
-                            jumps.append(jump_path)      
-
-                            # if there is already a jump in the path append to it  
-                            if taken_count_copy > 0:                                     
-                                jump_piece = np.append(pieces_taken[prev_jump_copy + j - 1], jump_piece, axis=0)
-
-                            # update the taken pieces and jumps
-                            pieces_taken.append(jump_piece)
-                            current_jump += 1
-                            taken_count += 1
-
-                # jump up + backward
-                if row - 2 >= 0:
-                    move = np.array([[row - 2, col - (2 * forward)]])
-                    jump_piece = np.array([[row - 1, col - forward]])
-
-                    # if the move is onto an empty space and the jump is over an enemy piece
-                    if (np.any((empty_spaces == move[0]).all(axis=1)) or np.array_equal(coord, move[0])) and np.any((enemy_piece_locations == jump_piece[0]).all(axis=1)):        
-
-                        # check if this jump is over the piece previously jumped
-                        condition = False
-                        if taken_count_copy > 0:
-                            condition = np.any((pieces_taken[prev_jump_copy + j - 1] == jump_piece[0]).all(axis=1))
-
-                        if not condition:
-
-                            # add new jump to path
-                            jump_path = np.append(new_jump_coord, move,  axis=0)
-                            jumps.append(jump_path)      
-
-                            # if there is already a jump in the path append to it  
-                            if taken_count_copy > 0:                                     
-                                jump_piece = np.append(pieces_taken[prev_jump_copy + j - 1], jump_piece, axis=0)
-
-                            # update the taken pieces and jumps
-                            pieces_taken.append(jump_piece)
-                            current_jump += 1
-                            taken_count += 1                             
-
-            # if no new jumps were added
-            if current_jump == prev_jump:
-                break
-
-         # return the moves for all normal pieces              
-
-        # if there were any jump moves
-        if len(jumps) > 1:
-
-            cleaned_jumps = list()
-            cleaned_takes = list()
-
-            for i in range(1, len(jumps)):  
-
-                intermediate = False
-
-                # check if this is an intermediate step
-                for j in range(i + 1, len(jumps)):                             
-                    if np.array_equal(jumps[i], jumps[j][:-1, :]): 
-                        intermediate = True
-
-                if not intermediate:                             
-                    cleaned_jump = jumps[i][-1, :]
-                    cleaned_jumps.append(cleaned_jump)
-
-                    cleaned_take = pieces_taken[i - 1]
-                    cleaned_takes.append(cleaned_take)
-
-            possible_moves[(coord[0], coord[1])] = np.array(cleaned_jumps)
-            possible_pieces_taken[(coord[0], coord[1])] = cleaned_takes
-
-        else:
+        man_type, king_type, enemy_sign = 1, 2, -1
+
+    # for regular pieces and then king pieces --------------------------
+    for piece_type, table, is_king in ((man_type, men_table, False), (king_type, king_table, True)):
+        for row, col in np.argwhere(data == piece_type).tolist():
+
+            # calculate jump moves --------------------------
+            sequences = _capture_sequences(table, cells, row, col, enemy_sign, is_king)
+            if len(sequences) > 0:
+                possible_moves[(row, col)] = np.array([landing for landing, _ in sequences])
+                possible_pieces_taken[(row, col)] = [np.array(taken) for _, taken in sequences]
+                continue
+            
+            # calculate simple moves --------------------------
+            moves = [(step_row, step_col) for step_row, step_col in table[row][col][0] if cells[step_row][step_col] == 0]
+            
             # if there were any normal moves
-            if moves.shape[0] > 0:                    
-                possible_moves[(coord[0], coord[1])] = moves
+            if len(moves) > 0:
+                possible_moves[(row, col)] = np.array(moves)
 
     return possible_moves, possible_pieces_taken  
 
@@ -419,4 +161,43 @@ def update_board(player, chosen_piece, chosen_move, chosen_take, data, size):
         for i in range(chosen_take.shape[0]):                    
             data[chosen_take[i, 0], chosen_take[i, 1]] = 0    
             
-    return data    
\ No newline at end of file
+    return data    
+
+
+# available move generation backends
+MOVE_GENERATORS = {
+    'numpy': get_moves,
+    'bitboard': get_moves_bitboard,
+}
+
+
+"""
+Return the move generation function for the chosen backend.
+"""
+def get_move_generator(backend):
+    assert backend in MOVE_GENERATORS, "Backend must be one of {}".format(list(MOVE_GENERATORS))
+    return MOVE_GENERATORS[backend]
+
+
+"""
+Return the legal moves for a given player as a list of packed moves.
+"""
+def get_packed_moves(player, data, size):
+    possible_moves, pieces_taken = get_moves(player, data, size)
+    return pack_moves(player, possible_moves, pieces_taken, data, size)
+
+
+# available packed move generation backends
+PACKED_MOVE_GENERATORS = {
+    'numpy': get_packed_moves,
+    'bitboard': get_packed_moves_bitboard,
+    'kernel': get_packed_moves_kernel,
+}
+
+
+"""
+Return the packed move generation function for the chosen backend.
+"""
+def get_packed_move_generator(backend):
+    assert backend in PACKED_MOVE_GENERATORS, "Backend must be one of {}".format(list(PACKED_MOVE_GENERATORS))
+    return PACKED_MOVE_GENERATORS[backend]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:02:37 2026
+
+@author: hemerson
+"""
+
+"""
+Read-only opening book compiled from the trained statistics. The entries are
+sorted by key and memory-mapped, so the book opens without reading the file
+and agent processes using the same book share its pages.
+"""
+
+import os
+
+import numpy as np
+
+# the file starts with a header of eight 64-bit integers holding the file
+# marker and the number of entries, followed by the keys, values and plays
+HEADER_BYTES = 64
+FILE_MARKER = 0x4D4354534B4F4F42
+
+# bytes used by a single entry (key, value, plays)
+ENTRY_BYTES = 20
+
+# fewest plays of a position for its value to be trusted over a search,
+# since the value of a position with few plays is mostly playout noise
+BOOK_MIN_PLAYS = 20
+
+
+"""
+Write the positions of a transposition table with at least min_plays plays
+to a book file.
+"""
+def build_book(table, filename, min_plays=BOOK_MIN_PLAYS):
+
+    filled = np.flatnonzero((table.keys != 0) & (table.plays >= min_plays))
+    order = np.argsort(table.keys[filled])
+    entries = filled[order]
+    count = len(entries)
+
+    # write to a temporary file so that the old book is never left half written
+    temp_filename = filename + '.tmp'
+    mapped = np.memmap(temp_filename, dtype=np.uint8, mode='w+', shape=(HEADER_BYTES + count * ENTRY_BYTES,))
+
+    header = np.ndarray(8, dtype=np.uint64, buffer=mapped)
+    header[:2] = [FILE_MARKER, count]
+    keys, values, plays = _book_arrays(mapped, count)
+    keys[:] = table.keys[entries]
+    values[:] = table.values[entries]
+    plays[:] = table.plays[entries]
+
+    mapped.flush()
+    os.replace(temp_filename, filename)
+
+    return count
+
+
+"""
+Return the keys, values and plays of a book as views of the mapped file.
+"""
+def _book_arrays(mapped, count):
+    keys = np.ndarray(count, dtype=np.uint64, buffer=mapped, offset=HEADER_BYTES)
+    values = np.ndarray(count, dtype=np.float64, buffer=mapped, offset=HEADER_BYTES + count * 8)
+    plays = np.ndarray(count, dtype=np.int32, buffer=mapped, offset=HEADER_BYTES + count * 16)
+    return keys, values, plays
+
+
+"""
+Defines the opening book, which is looked up by binary search on the keys.
+"""
+class OpeningBook:
+    def __init__(self, filename):
+
+        self.filename = filename
+        mapped = np.memmap(filename, dtype=np.uint8, mode='r')
+        header = np.ndarray(8, dtype=np.uint64, buffer=mapped)
+
+        # ensure the file is correct
+        assert int(header[0]) == FILE_MARKER, "{} is not an opening book".format(filename)
+
+        self.count = int(header[1])
+        self.keys, self.values, self.plays = _book_arrays(mapped, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.find(key) >= 0
+
+    """
+    Return the index of the key in the book or -1 if it is not in the book.
+    """
+    def find(self, key):
+
+        # 0 is reserved for empty slots of the table the book was built from
+        key = key or 1
+
+        idx = int(np.searchsorted(self.keys, np.uint64(key)))
+        if idx < self.count and self.keys.item(idx) == key:
+            return idx
+        return -1
+
+    """
+    Return the plays and value for the key, or zeros if it is not in the book.
+    """
+    def get(self, key):
+        idx = self.find(key)
+        if idx < 0:
+            return 0, 0.0
+        return self.plays.item(idx), self.values.item(idx)
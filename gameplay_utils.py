@@ -8,8 +8,10 @@ Created on Tue Mar 29 18:47:54 2022
 
 from board import Board
 from agent import Random_Actor
+from kernels import seed_kernels
 
-import time, imageio, os
+import time, imageio, os, random, multiprocessing
+import numpy as np
 
 """
 Train Monte Carlo Tree Search via Self-Play
@@ -20,67 +22,172 @@ def train_mcts(mcts_agent, max_games, max_moves, size, save_filename, load_filen
     agent_black = mcts_agent(player='black', size=size)   
     
     if load_filename != None:
-        print('Data loaded from plays{0}.pkl and values{0}.pkl'.format(load_filename))
-        agent_white.load_values(filename=load_filename)
+        print('Data loaded from table{0}.dat'.format(load_filename))
+        agent_white.load_values(filename=load_filename, writable=load_filename == save_filename)
     
     for game in range(1, max_games + 1):
         
-        print('Game {}'.format(game))
-        board = Board(size=size) 
-        
-        for mov in range(max_moves):
-            
-            if (mov + 1) % 10 == 0: print('Move {}'.format(mov))
-            
-            # get the possible moves for white
-            possible_actions, possible_takes = board.get_moves('white')
-            if len(possible_actions) == 0:
-                print('Game {}: Black/Red wins'.format(game))
-                break    
-            
-            if debug: tic = time.perf_counter()
-            
-            # select an action and update the board
-            chosen_piece, chosen_move, chosen_take = agent_white.select_action(possible_actions, possible_takes, board.data)
-            board.update('white', chosen_piece, chosen_move, chosen_take) 
-            
-            if debug:
-                toc = time.perf_counter() 
-                print('Selecting action: {}s'.format(toc - tic))  
-            
-            # share knowledge between players
-            agent_black.values = agent_white.values
-            agent_black.plays = agent_white.plays
-            
-            # get the possible moves for black
-            possible_actions, possible_takes = board.get_moves('black')
-            if len(possible_actions) == 0:
-                print('Game {}: White/Gray wins'.format(game))
-                break                  
-            
-            # select an action to update the board
-            chosen_piece, chosen_move, chosen_take = agent_black.select_action(possible_actions, possible_takes, board.data)
-            board.update('black', chosen_piece, chosen_move, chosen_take)  
-            
-            # share knowledge between players
-            agent_white.values = agent_black.values
-            agent_black.plays = agent_white.plays
-            
-            # terminate when max moves exceeded
-            if mov == (max_moves - 1):
-                print('Game {}: Stalemate'.format(game))   
-                break        
+        play_training_game(agent_white, agent_black, max_moves, size, game, debug)
         
         # save dictionary
         agent_white.save_values(filename=save_filename)
-        print('Performed {} moves'.format(len(agent_white.values)))
+        print('Performed {} moves'.format(len(agent_white.table)))
+
+
+"""
+Train Monte Carlo Tree Search via Self-Play using several processes. Each 
+worker plays games_per_merge games from a copy of the current statistics, 
+then the changes from every worker are merged into the master table which 
+is saved every checkpoint_every games.
+"""
+def train_mcts_parallel(mcts_agent, max_games, max_moves, size, save_filename, load_filename=None, 
+                        workers=4, games_per_merge=1, checkpoint_every=None):
+    
+    agent_white = mcts_agent(player='white', size=size)
+    
+    if load_filename != None:
+        print('Data loaded from table{0}.dat'.format(load_filename))
+        agent_white.load_values(filename=load_filename, writable=load_filename == save_filename)
+    
+    if checkpoint_every is None:
+        checkpoint_every = workers * games_per_merge
+    
+    game, last_checkpoint = 0, 0
+    while game < max_games:
+        
+        # share the games for this round between the workers
+        tasks = list()
+        for i in range(workers):
+            number_games = min(games_per_merge, max_games - game)
+            if number_games <= 0: break
+            tasks.append((mcts_agent, number_games, max_moves, size, game + 1, np.random.randint(2**31 - 1)))
+            game += number_games
+        
+        # each worker starts from a copy of the master statistics
+        with multiprocessing.Pool(len(tasks), initializer=_init_trainer, initargs=(agent_white,)) as pool:
+            results = pool.map(_self_play, tasks)
+        
+        # merge the changes into the master table
+        for keys, delta_plays, delta_values in results:
+            agent_white.table.merge(keys, delta_plays, delta_values)
+        print('Merged {} games: {} moves'.format(game, len(agent_white.table)))
+        
+        # save dictionary
+        if game - last_checkpoint >= checkpoint_every or game == max_games:
+            agent_white.save_values(filename=save_filename)
+            last_checkpoint = game
+            
+    return agent_white
+
+
+"""
+Return the keyword arguments passing the hash kept by the board to the 
+agent's select_action, if the agent hashes boards with the same table.
+"""
+def board_hash(agent, board):
+    hash_table = getattr(agent, 'hash_table', None)
+    if board.hash_table is None or hash_table is None:
+        return {}
+    if hash_table is not board.hash_table and not np.array_equal(hash_table, board.hash_table):
+        return {}
+    return {'input_hash': board.key}
+
+
+"""
+Play a single game of self-play between two MCTS agents which share their statistics.
+"""
+def play_training_game(agent_white, agent_black, max_moves, size, game, debug=False):
+    
+    print('Game {}'.format(game))
+    board = Board(size=size, hash_table=agent_white.hash_table) 
+    
+    # share knowledge between players
+    agent_black.table = agent_white.table
+    
+    for mov in range(max_moves):
+        
+        if (mov + 1) % 10 == 0: print('Move {}'.format(mov))
+        
+        # get the possible moves for white
+        possible_actions, possible_takes = board.get_moves('white')
+        if len(possible_actions) == 0:
+            print('Game {}: Black/Red wins'.format(game))
+            break    
+        
+        if debug: tic = time.perf_counter()
+        
+        # select an action and update the board
+        chosen_piece, chosen_move, chosen_take = agent_white.select_action(possible_actions, possible_takes, board.data, **board_hash(agent_white, board))
+        board.update('white', chosen_piece, chosen_move, chosen_take) 
+        
+        if debug:
+            toc = time.perf_counter() 
+            print('Selecting action: {}s'.format(toc - tic))  
+        
+        # get the possible moves for black
+        possible_actions, possible_takes = board.get_moves('black')
+        if len(possible_actions) == 0:
+            print('Game {}: White/Gray wins'.format(game))
+            break                  
+        
+        # select an action to update the board
+        chosen_piece, chosen_move, chosen_take = agent_black.select_action(possible_actions, possible_takes, board.data, **board_hash(agent_black, board))
+        board.update('black', chosen_piece, chosen_move, chosen_take)  
+        
+        # terminate when max moves exceeded
+        if mov == (max_moves - 1):
+            print('Game {}: Stalemate'.format(game))   
+            break        
+
+
+# the master agent copied into each training worker
+_trainer_agent = None
+
+
+"""
+Store a copy of the master agent in the training worker.
+"""
+def _init_trainer(agent):
+    global _trainer_agent
+    _trainer_agent = agent
+    
+    # keep the changes made by the worker out of the saved file
+    agent.table.make_private()
+
+
+"""
+Play a batch of self-play games in a worker and return the changes made 
+to the statistics.
+"""
+def _self_play(task):
+    mcts_agent, number_games, max_moves, size, first_game, seed = task
+    
+    # ensure the workers play different games
+    random.seed(seed)
+    np.random.seed(seed)
+    seed_kernels(seed)
+    
+    agent_white = _trainer_agent
+    agent_black = mcts_agent(player='black', size=size)
+    snapshot = agent_white.table.snapshot()
+    
+    for game in range(first_game, first_game + number_games):
+        play_training_game(agent_white, agent_black, max_moves, size, game)
+    
+    return agent_white.table.changes(snapshot)
 
 
 """
 Play a single game between two specified agents 
-and visualise the results.
+and visualise the results. If ponder is set the MCTS agents
+search in a background process on their opponent's turn.
 """
-def play_game(agent_white, agent_black, board, max_moves, visual="terminal"):
+def play_game(agent_white, agent_black, board, max_moves, visual="terminal", ponder=False):
+    
+    # keep the hash of the board with the zobrist table of the agents
+    for agent in (agent_white, agent_black):
+        if board.hash_table is None and hasattr(agent, 'hash_table'):
+            board.set_hash_table(agent.hash_table)
     
     for mov in range(max_moves):
         
@@ -95,10 +202,14 @@ def play_game(agent_white, agent_black, board, max_moves, visual="terminal"):
             print('Black/Red has won the game!')
             break     
             
-        chosen_piece, chosen_move, chosen_take = agent_white.select_action(possible_actions, possible_takes, board.data)
+        chosen_piece, chosen_move, chosen_take = agent_white.select_action(possible_actions, possible_takes, board.data, **board_hash(agent_white, board))
         print('White moves {} to {}\n'.format(chosen_piece, (chosen_move[0], chosen_move[1])))
         board.update('white', chosen_piece, chosen_move, chosen_take)     
         
+        # search while the other player decides
+        if ponder and hasattr(agent_white, 'start_pondering'):
+            agent_white.start_pondering(board.data)
+        
         #--------------------------------------------- 
         
         print('Move: {} ---------------------------\n'.format(2*mov + 2))
@@ -112,24 +223,39 @@ def play_game(agent_white, agent_black, board, max_moves, visual="terminal"):
             print('White/Gray has won the game!')
             break        
         
-        chosen_piece, chosen_move, chosen_take = agent_black.select_action(possible_actions, possible_takes, board.data)
+        chosen_piece, chosen_move, chosen_take = agent_black.select_action(possible_actions, possible_takes, board.data, **board_hash(agent_black, board))
         print('Black moves {} to {}\n'.format(chosen_piece, (chosen_move[0], chosen_move[1])))
         board.update('black', chosen_piece, chosen_move, chosen_take)     
         
+        # search while the other player decides
+        if ponder and hasattr(agent_black, 'start_pondering'):
+            agent_black.start_pondering(board.data)
+        
         #---------------------------------------------      
         
         if mov == (max_moves - 1):
             print('The game has ended as a stalemate!')
             break
+    
+    # stop searching now the game is over
+    for agent in (agent_white, agent_black):
+        if hasattr(agent, 'stop_pondering'):
+            agent.stop_pondering()
             
 """
 Play a single game against a specified player with a 
-human acting as the black player.
+human acting as the black player. If ponder is set the 
+agent searches in a background process while the human
+chooses a move.
 """            
-def play_player(agent_white, board, max_moves, visual="terminal"):
+def play_player(agent_white, board, max_moves, visual="terminal", ponder=False):
     
     agent_black = Random_Actor('black')
     
+    # keep the hash of the board with the zobrist table of the agent
+    if board.hash_table is None and hasattr(agent_white, 'hash_table'):
+        board.set_hash_table(agent_white.hash_table)
+    
     for mov in range(max_moves):
         
         print('Move: {} ---------------------------\n'.format(2* mov + 1))
@@ -143,10 +269,14 @@ def play_player(agent_white, board, max_moves, visual="terminal"):
             print('Black/Red has won the game!')
             break     
             
-        chosen_piece, chosen_move, chosen_take = agent_white.select_action(possible_actions, possible_takes, board.data)
+        chosen_piece, chosen_move, chosen_take = agent_white.select_action(possible_actions, possible_takes, board.data, **board_hash(agent_white, board))
         print('White/Gray moves {} to {}\n'.format(chosen_piece, (chosen_move[0], chosen_move[1])))
         board.update('white', chosen_piece, chosen_move, chosen_take)     
         
+        # search while the player chooses a move
+        if ponder and hasattr(agent_white, 'start_pondering'):
+            agent_white.start_pondering(board.data)
+        
         #------------------------------------------------
         
         print('Move: {} ---------------------------\n'.format(2*mov + 2))
@@ -199,6 +329,10 @@ def play_player(agent_white, board, max_moves, visual="terminal"):
         if mov == (max_moves - 1):
             print('The game has ended as a stalemate!')
             break  
+    
+    # stop searching now the game is over
+    if hasattr(agent_white, 'stop_pondering'):
+        agent_white.stop_pondering()
 
 
 def convert_image_to_gif(filename):   
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:31:52 2026
+
+@author: hemerson
+"""
+
+"""
+Compiled kernels for move generation, move application and random playouts.
+The kernels only use NumPy arrays and scalars so they can be compiled with
+Numba. If Numba is not installed they run as plain Python, which gives the
+same results but much more slowly.
+
+Moves are held in preallocated arrays: the start and end squares (row, col),
+whether the piece is promoted and the squares of the pieces taken.
+"""
+
+import threading
+
+import numpy as np
+
+from move_utils import pack_move
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    """
+    Leave the function as plain Python when Numba is not installed.
+    """
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+# the most moves and pieces taken in a single move that are recorded
+MAX_MOVES = 256
+MAX_TAKES = 32
+
+# the diagonal directions as (row, col) steps, forward for white first, the
+# order for black starts from the third direction
+KERNEL_DIRECTIONS = np.array([[1, 1], [-1, 1], [1, -1], [-1, -1]], dtype=np.int64)
+
+# value marking a piece already taken during a multiple capture
+TAKEN = 9
+
+# the move arrays reused by get_packed_moves_kernel in each thread
+_thread_buffers = threading.local()
+
+
+"""
+Return the arrays used to hold the moves generated by the kernels.
+"""
+def move_buffers():
+    move_squares = np.zeros((MAX_MOVES, 4), dtype=np.int64)
+    move_promotes = np.zeros(MAX_MOVES, dtype=np.bool_)
+    move_takes = np.zeros((MAX_MOVES, MAX_TAKES, 2), dtype=np.int64)
+    move_take_counts = np.zeros(MAX_MOVES, dtype=np.int64)
+    return move_squares, move_promotes, move_takes, move_take_counts
+
+
+"""
+Return the move arrays of the current thread, allocating them on first use.
+Every move generated overwrites the fields it uses, so they are not cleared.
+"""
+def thread_move_buffers():
+    if not hasattr(_thread_buffers, 'buffers'):
+        _thread_buffers.buffers = move_buffers()
+    return _thread_buffers.buffers
+
+
+"""
+Record the jump sequences of the piece at (row, col) which cannot be extended
+any further, using a depth first search. Returns the new number of moves.
+"""
+@njit(cache=True)
+def _kernel_jumps(board, size, row, col, sign, is_king, move_squares, move_promotes, move_takes, move_take_counts, count):
+
+    forward = -sign
+    king_col = size - 1 if sign < 0 else 0
+    first_direction = 0 if sign < 0 else 2
+    piece_type = board[row, col]
+
+    # the path of the search, with the next direction to try at each step
+    path = np.zeros((MAX_TAKES + 1, 2), dtype=np.int64)
+    taken = np.zeros((MAX_TAKES, 3), dtype=np.int64)
+    next_direction = np.zeros(MAX_TAKES + 1, dtype=np.int64)
+    extended = np.zeros(MAX_TAKES + 1, dtype=np.bool_)
+
+    # the start square is empty while the piece is jumping
+    board[row, col] = 0
+    path[0, 0], path[0, 1] = row, col
+    depth = 0
+
+    while depth >= 0:
+
+        if next_direction[depth] < 4 and depth < MAX_TAKES:
+            d = (first_direction + next_direction[depth]) % 4
+            d_row, d_col = KERNEL_DIRECTIONS[d, 0], KERNEL_DIRECTIONS[d, 1]
+            next_direction[depth] += 1
+
+            # men only move towards the opposing side
+            if not is_king and d_col != forward:
+                continue
+
+            jump_row, jump_col = path[depth, 0] + d_row, path[depth, 1] + d_col
+            land_row, land_col = path[depth, 0] + 2 * d_row, path[depth, 1] + 2 * d_col
+            if land_row < 0 or land_row >= size or land_col < 0 or land_col >= size:
+                continue
+
+            # jump onto an empty square over an enemy piece not already taken
+            jumped = board[jump_row, jump_col]
+            if jumped * sign < 0 and abs(jumped) <= 2 and board[land_row, land_col] == 0:
+                extended[depth] = True
+                taken[depth, 0], taken[depth, 1], taken[depth, 2] = jump_row, jump_col, jumped
+                board[jump_row, jump_col] = TAKEN
+
+                depth += 1
+                path[depth, 0], path[depth, 1] = land_row, land_col
+                next_direction[depth] = 0
+                extended[depth] = False
+
+        else:
+            # record a sequence which cannot be extended
+            if depth > 0 and not extended[depth] and count < MAX_MOVES:
+                move_squares[count, 0], move_squares[count, 1] = row, col
+                move_squares[count, 2], move_squares[count, 3] = path[depth, 0], path[depth, 1]
+                move_promotes[count] = not is_king and path[depth, 1] == king_col
+                for i in range(depth):
+                    move_takes[count, i, 0], move_takes[count, i, 1] = taken[i, 0], taken[i, 1]
+                move_take_counts[count] = depth
+                count += 1
+
+            # step back, returning the last piece taken
+            if depth > 0:
+                board[taken[depth - 1, 0], taken[depth - 1, 1]] = taken[depth - 1, 2]
+            depth -= 1
+
+    board[row, col] = piece_type
+
+    return count
+
+
+"""
+Fill the move arrays with the legal moves for the player whose pieces have
+the given sign (-1 for white and +1 for black) and return the number of
+moves. If any jumps are available only the jumps are returned.
+"""
+@njit(cache=True)
+def kernel_moves(board, size, sign, move_squares, move_promotes, move_takes, move_take_counts):
+
+    forward = -sign
+    king_col = size - 1 if sign < 0 else 0
+    first_direction = 0 if sign < 0 else 2
+    count = 0
+
+    # calculate jump moves, men first and then kings --------------------------
+    for piece in (1, 2):
+        for row in range(size):
+            for col in range(size):
+                if board[row, col] * sign != piece:
+                    continue
+                count = _kernel_jumps(board, size, row, col, sign, piece == 2, move_squares, move_promotes, move_takes, move_take_counts, count)
+
+    if count > 0:
+        return count
+
+    # calculate simple moves --------------------------
+    for piece in (1, 2):
+        for row in range(size):
+            for col in range(size):
+                if board[row, col] * sign != piece:
+                    continue
+
+                for i in range(4):
+                    d = (first_direction + i) % 4
+                    d_row, d_col = KERNEL_DIRECTIONS[d, 0], KERNEL_DIRECTIONS[d, 1]
+                    if piece == 1 and d_col != forward:
+                        continue
+
+                    new_row, new_col = row + d_row, col + d_col
+                    if new_row < 0 or new_row >= size or new_col < 0 or new_col >= size:
+                        continue
+
+                    if board[new_row, new_col] == 0 and count < MAX_MOVES:
+                        move_squares[count, 0], move_squares[count, 1] = row, col
+                        move_squares[count, 2], move_squares[count, 3] = new_row, new_col
+                        move_promotes[count] = piece == 1 and new_col == king_col
+                        move_take_counts[count] = 0
+                        count += 1
+
+    return count
+
+
+"""
+Make the move at the given index of the move arrays on the board.
+"""
+@njit(cache=True)
+def kernel_apply(board, index, move_squares, move_promotes, move_takes, move_take_counts):
+
+    piece_type = board[move_squares[index, 0], move_squares[index, 1]]
+    if move_promotes[index]:
+        piece_type = 2 * piece_type
+
+    board[move_squares[index, 0], move_squares[index, 1]] = 0
+    board[move_squares[index, 2], move_squares[index, 3]] = piece_type
+
+    # remove the taken pieces
+    for i in range(move_take_counts[index]):
+        board[move_takes[index, i, 0], move_takes[index, i, 1]] = 0
+
+
+"""
+Play a random game on the board until it ends and return the outcome (1 if
+white wins, -1 if black wins and 0 for a stalemate) and the number of moves
+played. Each move picks a random piece and then a random move for that piece.
+The board is changed in place.
+"""
+@njit(cache=True)
+def kernel_playout(board, size, sign, max_move_count):
+
+    move_squares = np.zeros((MAX_MOVES, 4), dtype=np.int64)
+    move_promotes = np.zeros(MAX_MOVES, dtype=np.bool_)
+    move_takes = np.zeros((MAX_MOVES, MAX_TAKES, 2), dtype=np.int64)
+    move_take_counts = np.zeros(MAX_MOVES, dtype=np.int64)
+    piece_starts = np.zeros(MAX_MOVES + 1, dtype=np.int64)
+
+    move_count = 0
+    while True:
+
+        # stop games with too few pieces or too many moves as a stalemate
+        pieces = 0
+        for row in range(size):
+            for col in range(size):
+                if board[row, col] != 0:
+                    pieces += 1
+        if pieces < 3 or move_count > max_move_count:
+            return 0, move_count
+
+        # the player who cannot move loses
+        count = kernel_moves(board, size, sign, move_squares, move_promotes, move_takes, move_take_counts)
+        if count == 0:
+            return sign, move_count
+
+        # the moves of each piece are next to each other
+        number_pieces = 0
+        for i in range(count):
+            if i == 0 or move_squares[i, 0] != move_squares[i - 1, 0] or move_squares[i, 1] != move_squares[i - 1, 1]:
+                piece_starts[number_pieces] = i
+                number_pieces += 1
+        piece_starts[number_pieces] = count
+
+        # randomly select a piece and then a move for that piece
+        piece = np.random.randint(0, number_pieces)
+        index = np.random.randint(piece_starts[piece], piece_starts[piece + 1])
+
+        kernel_apply(board, index, move_squares, move_promotes, move_takes, move_take_counts)
+
+        # update the current player
+        sign = -sign
+        move_count += 1
+
+
+"""
+Seed the random number generator of the kernels, which is separate from
+that of NumPy when they are compiled with Numba.
+"""
+@njit(cache=True)
+def seed_kernels(seed):
+    np.random.seed(seed)
+
+
+"""
+Return the sign of the pieces of a player, -1 for white and +1 for black.
+"""
+def player_sign(player):
+    return -1 if player == 'white' else 1
+
+
+"""
+Return the legal moves for a given player as a list of packed moves using
+the kernels, in the same order as the other backends.
+"""
+def get_packed_moves_kernel(player, data, size):
+
+    board = data.astype(np.int8)
+    move_squares, move_promotes, move_takes, move_take_counts = thread_move_buffers()
+    count = kernel_moves(board, size, player_sign(player), move_squares, move_promotes, move_takes, move_take_counts)
+
+    packed_moves = list()
+    for i in range(count):
+        take_mask = 0
+        for j in range(move_take_counts[i]):
+            take_mask |= 1 << int(move_takes[i, j, 0] * size + move_takes[i, j, 1])
+
+        from_square = int(move_squares[i, 0] * size + move_squares[i, 1])
+        to_square = int(move_squares[i, 2] * size + move_squares[i, 3])
+        packed_moves.append(pack_move(from_square, to_square, take_mask, bool(move_promotes[i])))
+
+    return packed_moves
+
+
+"""
+Play a random game from a copy of the board with the given player to move
+and return the outcome and the number of moves played.
+"""
+def random_playout(current_board, player, size, max_move_count=200):
+    outcome, move_count = kernel_playout(current_board.astype(np.int8), size, player_sign(player), max_move_count)
+    return int(outcome), int(move_count)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:08:15 2026
+
+@author: hemerson
+"""
+
+"""
+Moves packed into a single integer. Squares are numbered (row * size + col)
+and each move holds the square it starts from, the square it ends on,
+whether the piece is promoted and a mask with a bit set for each square
+taken. The functions here convert to and from the dictionaries returned
+by get_moves.
+
+Each square is held in SQUARE_BITS bits, so packed moves can only be used
+on boards of up to MAX_SIZE by MAX_SIZE squares.
+"""
+
+import math
+
+import numpy as np
+
+# layout of the bits of a packed move
+SQUARE_BITS = 8
+SQUARE_MASK = (1 << SQUARE_BITS) - 1
+PROMOTE_SHIFT = 2 * SQUARE_BITS
+TAKE_SHIFT = PROMOTE_SHIFT + 1
+
+# the largest board with every square number fitting in SQUARE_BITS bits
+MAX_SIZE = math.isqrt(1 << SQUARE_BITS)
+
+
+"""
+Pack a move into an integer.
+"""
+def pack_move(from_square, to_square, take_mask=0, promotes=False):
+    return from_square | (to_square << SQUARE_BITS) | (int(promotes) << PROMOTE_SHIFT) | (take_mask << TAKE_SHIFT)
+
+
+"""
+Return the start square, end square, promotion flag and taken mask of a packed move.
+"""
+def move_fields(move):
+    return move & SQUARE_MASK, (move >> SQUARE_BITS) & SQUARE_MASK, (move >> PROMOTE_SHIFT) & 1, move >> TAKE_SHIFT
+
+
+"""
+Return the start square of a packed move.
+"""
+def move_from(move):
+    return move & SQUARE_MASK
+
+
+"""
+Return the squares in a mask of taken pieces in ascending order.
+"""
+def taken_squares(take_mask):
+    squares = list()
+    while take_mask:
+        low_bit = take_mask & -take_mask
+        squares.append(low_bit.bit_length() - 1)
+        take_mask ^= low_bit
+    return squares
+
+
+"""
+Convert the moves returned by get_moves into a list of packed moves. If any
+jumps are available only the jumps are kept, in accordance with the rules
+of english draughts.
+"""
+def pack_moves(player, possible_moves, pieces_taken, data, size):
+
+    assert size <= MAX_SIZE, "Packed moves only support boards up to size {}".format(MAX_SIZE)
+
+    king_col = size - 1 if player == 'white' else 0
+    packed_moves = list()
+
+    for chosen_piece, moves in possible_moves.items():
+
+        # ensure jump moves are prioritised if possible
+        if len(pieces_taken) > 0 and chosen_piece not in pieces_taken:
+            continue
+
+        from_square = int(chosen_piece[0]) * size + int(chosen_piece[1])
+        is_man = abs(data[chosen_piece[0], chosen_piece[1]]) == 1
+
+        for i in range(moves.shape[0]):
+            row, col = int(moves[i, 0]), int(moves[i, 1])
+
+            take_mask = 0
+            if len(pieces_taken) > 0:
+                for take_row, take_col in pieces_taken[chosen_piece][i]:
+                    take_mask |= 1 << (int(take_row) * size + int(take_col))
+
+            packed_moves.append(pack_move(from_square, row * size + col, take_mask, is_man and col == king_col))
+
+    return packed_moves
+
+
+"""
+Convert a packed move into the chosen piece (tuple), chosen move (array) and
+pieces taken (array of coordinates or an empty list) used by update_board.
+"""
+def unpack_move(move, size):
+
+    from_square, to_square, _, take_mask = move_fields(move)
+
+    chosen_piece = divmod(from_square, size)
+    chosen_move = np.array(divmod(to_square, size))
+
+    chosen_take = []
+    if take_mask:
+        chosen_take = np.array([divmod(square, size) for square in taken_squares(take_mask)])
+
+    return chosen_piece, chosen_move, chosen_take
+
+
+"""
+Make a packed move on the board, updating it in place. Returns a mask of the
+taken squares which held kings, which unmake_move needs to restore the board.
+"""
+def make_move(move, data, size):
+
+    from_square, to_square, promotes, take_mask = move_fields(move)
+    flat = data.reshape(-1)
+
+    # move the piece, crowning it if it reaches the far side
+    piece_type = flat[from_square]
+    if promotes:
+        piece_type = 2 * piece_type
+
+    flat[from_square] = 0
+    flat[to_square] = piece_type
+
+    # remove the taken pieces, remembering which were kings
+    king_mask = 0
+    for square in taken_squares(take_mask):
+        if abs(flat[square]) == 2:
+            king_mask |= 1 << square
+        flat[square] = 0
+
+    return king_mask
+
+
+"""
+Undo a packed move made by make_move, restoring the board exactly.
+"""
+def unmake_move(move, king_mask, data, size):
+
+    from_square, to_square, promotes, take_mask = move_fields(move)
+    flat = data.reshape(-1)
+
+    # move the piece back, removing the crown if it was promoted
+    piece_type = flat[to_square]
+    if promotes:
+        piece_type = piece_type // 2
+
+    flat[to_square] = 0
+    flat[from_square] = piece_type
+
+    # return the taken pieces, which belong to the other player
+    enemy_sign = -1 if piece_type > 0 else 1
+    for square in taken_squares(take_mask):
+        flat[square] = enemy_sign * (2 if (king_mask >> square) & 1 else 1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:58:14 2026
+
+@author: hemerson
+"""
+
+"""
+Telemetry collected by the MCTS agent during a search.
+"""
+
+# the phases of a search which are timed
+PHASES = ('selection', 'expansion', 'playout', 'backpropagation', 'choice')
+
+
+"""
+Defines the statistics of a single search: the time spent in each phase, the
+number of move generations, moves made and hashes computed, the length of
+the playouts, the size of the tree and how often the table held a position.
+"""
+class SearchStats:
+    def __init__(self):
+
+        # TIMING
+        # cumulative seconds spent in each phase and in the whole search
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.total_time = 0.0
+
+        # COUNTS
+        self.simulations = 0
+        self.move_generations = 0
+        self.moves_made = 0
+        self.hashes = 0
+        self.nodes_expanded = 0
+
+        # the playouts played to the end (or cutoff) and their total moves
+        self.playouts = 0
+        self.playout_moves = 0
+
+        # nodes in the search tree after the search
+        self.tree_size = 0
+
+        # table lookups and those which found the position
+        self.table_probes = 0
+        self.table_hits = 0
+
+    """
+    Return the average number of moves in a playout.
+    """
+    @property
+    def average_playout_length(self):
+        return self.playout_moves / self.playouts if self.playouts > 0 else 0.0
+
+    """
+    Return the fraction of table lookups which found the position.
+    """
+    @property
+    def table_hit_rate(self):
+        return self.table_hits / self.table_probes if self.table_probes > 0 else 0.0
+
+    """
+    Add the counts and phase times of the search of another process, such as
+    a worker of a parallel search. The phase times are then the total time
+    spent in each phase by every process.
+    """
+    def add(self, other):
+        for phase, seconds in other.phase_times.items():
+            self.phase_times[phase] += seconds
+
+        for name in ('simulations', 'move_generations', 'moves_made', 'hashes', 'nodes_expanded',
+                     'playouts', 'playout_moves', 'table_probes', 'table_hits'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    """
+    Return the statistics as a dictionary, which can be logged as JSON.
+    """
+    def as_dict(self):
+        stats = dict(self.__dict__)
+        stats['phase_times'] = dict(self.phase_times)
+        stats['average_playout_length'] = self.average_playout_length
+        stats['table_hit_rate'] = self.table_hit_rate
+        return stats
+
+    def __repr__(self):
+        phases = ', '.join('{}={:.3f}s'.format(phase, seconds) for phase, seconds in self.phase_times.items())
+        return ('SearchStats(total={:.3f}s, {}, simulations={}, move_generations={}, moves_made={}, hashes={}, '
+                'average_playout_length={:.1f}, tree_size={}, table_hit_rate={:.2f})').format(
+                    self.total_time, phases, self.simulations, self.move_generations, self.moves_made,
+                    self.hashes, self.average_playout_length, self.tree_size, self.table_hit_rate)
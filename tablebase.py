@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:25:44 2026
+
+@author: hemerson
+"""
+
+"""
+Endgame tablebase holding the exact result of every position with a small
+number of pieces, found by retrograde analysis.
+"""
+
+import itertools
+
+import numpy as np
+
+from board_utils import get_move_generator
+from agent_utils import hash_board, hash_move, init_zobrist
+
+
+"""
+Return the key of every legal position with up to max_pieces pieces for
+each player to move, whether white is to move and the keys of the positions
+reached by each legal move, as flat arrays with the index of the position
+each move is made from.
+"""
+def enumerate_positions(size, max_pieces, hash_table, backend='bitboard'):
+
+    move_generator = get_move_generator(backend)
+    squares = [(row, col) for row in range(size) for col in range(size) if (row + col) % 2 == 0]
+
+    keys, white_to_move, successor_keys, owners = list(), list(), list(), list()
+
+    for number_pieces in range(1, max_pieces + 1):
+        for placed in itertools.combinations(squares, number_pieces):
+            for pieces in itertools.product((1, 2, -1, -2), repeat=number_pieces):
+
+                # men are promoted on reaching the far side
+                if any((piece == -1 and col == size - 1) or (piece == 1 and col == 0)
+                       for (_, col), piece in zip(placed, pieces)):
+                    continue
+
+                board = np.zeros((size, size), dtype=int)
+                for (row, col), piece in zip(placed, pieces):
+                    board[row, col] = piece
+
+                for player in ('white', 'black'):
+                    key = hash_board(board, size, hash_table, player)
+                    owner = len(keys)
+                    keys.append(key)
+                    white_to_move.append(player == 'white')
+
+                    # ensure jump moves are prioritised if possible
+                    possible_moves, pieces_taken = move_generator(player, board, size)
+                    if len(pieces_taken) > 0:
+                        possible_moves = {coords: possible_moves[coords] for coords in pieces_taken}
+
+                    for chosen_piece, moves in possible_moves.items():
+                        for i in range(moves.shape[0]):
+                            chosen_take = pieces_taken[chosen_piece][i] if len(pieces_taken) > 0 else []
+                            successor_keys.append(hash_move(key, player, chosen_piece, moves[i], chosen_take, board, size, hash_table))
+                            owners.append(owner)
+
+    return (np.array(keys, dtype=np.uint64), np.array(white_to_move, dtype=bool),
+            np.array(successor_keys, dtype=np.uint64), np.array(owners, dtype=np.int64))
+
+
+"""
+Solve every position with up to max_pieces pieces and return the tablebase.
+Positions where the player to move has no moves are lost, positions with a
+move to a lost position are won and positions where every move leads to a
+won position are lost. This is repeated until nothing changes and the
+positions left unsolved are draws.
+"""
+def build_tablebase(size, max_pieces=3, backend='bitboard'):
+
+    hash_table = init_zobrist(size)
+    keys, white_to_move, successor_keys, owners = enumerate_positions(size, max_pieces, hash_table, backend)
+
+    # sort the positions by key and find the position reached by each move,
+    # which always has the same or fewer pieces
+    order = np.argsort(keys)
+    keys, white_to_move = keys[order], white_to_move[order]
+    owners = np.argsort(order)[owners]
+    successors = np.searchsorted(keys, successor_keys)
+    assert np.all(keys[np.minimum(successors, len(keys) - 1)] == successor_keys), "Missing successor position"
+
+    number_positions = len(keys)
+    number_moves = np.bincount(owners, minlength=number_positions)
+
+    # result for the player to move (1 win, -1 loss, 0 unknown)
+    results = np.zeros(number_positions, dtype=np.int8)
+    results[number_moves == 0] = -1
+
+    while True:
+        successor_results = results[successors]
+
+        # won if a move leaves the opponent lost, lost if every move leaves them won
+        won = np.zeros(number_positions, dtype=bool)
+        won[owners[successor_results == -1]] = True
+        lost = (np.bincount(owners, weights=successor_results == 1, minlength=number_positions) == number_moves) & (number_moves > 0)
+
+        new_results = np.where(won, 1, np.where(lost, -1, results)).astype(np.int8)
+        if np.array_equal(new_results, results):
+            break
+        results = new_results
+
+    # convert to the outcome (1 if white wins, -1 if black wins and 0 for a draw)
+    outcomes = np.where(white_to_move, results, -results).astype(np.int8)
+
+    return Tablebase(size, max_pieces, keys, outcomes)
+
+
+"""
+Defines the tablebase, which is looked up by binary search on the sorted keys.
+"""
+class Tablebase:
+    def __init__(self, size, max_pieces, keys, outcomes):
+        self.size = size
+        self.max_pieces = max_pieces
+        self.keys = keys
+        self.outcomes = outcomes
+
+        # the keys match those of the agents, which use the same seed
+        self.hash_table = init_zobrist(size)
+
+    def __len__(self):
+        return len(self.keys)
+
+    """
+    Return the outcome of the board with the given player to move (1 if white
+    wins, -1 if black wins and 0 for a draw), or None if it has too many pieces.
+    """
+    def probe(self, current_board, player):
+
+        if np.count_nonzero(current_board) > self.max_pieces:
+            return None
+
+        key = hash_board(current_board, self.size, self.hash_table, player)
+        idx = int(np.searchsorted(self.keys, np.uint64(key)))
+        if idx < len(self.keys) and self.keys.item(idx) == key:
+            return self.outcomes.item(idx)
+
+        return None
+
+    """
+    Save the tablebase to a compressed numpy file.
+    """
+    def save(self, filename):
+        np.savez_compressed(filename, size=self.size, max_pieces=self.max_pieces,
+                            keys=self.keys, outcomes=self.outcomes)
+
+    """
+    Load a tablebase saved to a numpy file.
+    """
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        return cls(int(data['size']), int(data['max_pieces']), data['keys'], data['outcomes'])
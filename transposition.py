@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 14:05:48 2026
+
+@author: hemerson
+"""
+
+"""
+Fixed size transposition table for the MCTS statistics.
+"""
+
+import os, multiprocessing, weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# the arrays making up the table, largest items first to keep them aligned
+FIELDS = (('keys', np.uint64), ('values', np.float64), ('plays', np.int32),
+          ('ages', np.uint32), ('virtual', np.int32))
+
+# bytes used by a single entry (key, value, plays, age, virtual visits)
+ENTRY_BYTES = sum(np.dtype(dtype).itemsize for _, dtype in FIELDS)
+
+# a saved table starts with a header of eight 64-bit integers holding
+# the file marker, capacity, probe limit, generation and count
+HEADER_BYTES = 64
+FILE_MARKER = 0x4D43545354543031
+
+
+"""
+Defines an open-addressed hash table storing the visit count and value of each
+position in NumPy arrays. The capacity is fixed by the memory budget and when
+all the slots for a key are full the least useful entry is replaced.
+"""
+class TranspositionTable:
+    def __init__(self, memory_mb=64, capacity=None, probe_limit=8):
+
+        # use the largest power of two which fits in the memory budget
+        if capacity is None:
+            capacity = 2 ** int(np.log2(max(memory_mb * 2**20 // ENTRY_BYTES, 1)))
+
+        # ensure the capacity is correct
+        assert capacity > 0 and capacity & (capacity - 1) == 0, "Capacity must be a power of 2"
+
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.probe_limit = min(probe_limit, capacity)
+
+        # STATISTICS
+        # a key of 0 marks an empty slot and virtual counts the
+        # in-flight visits of a parallel search
+        for name, dtype in FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+        # the current search generation and number of filled slots
+        self.generation = 0
+        self.count = 0
+
+        # lookups of a key (by get, store or in) and those which found it
+        self.probes = 0
+        self.hits = 0
+
+        # SHARING
+        # set when the arrays are placed in shared memory
+        self.shared_memory = None
+        self.lock = None
+
+        # STORAGE
+        # the file the table was last saved to or opened from to save back 
+        # to, and the generation of that save. Every entry changed since has
+        # a later age, so only those entries are written by the next save
+        self.filename = None
+        self.saved_generation = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.find(key) >= 0
+
+    """
+    Pickle a shared table by the name of its shared memory block rather
+    than by copying the arrays.
+    """
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        # a copy does not write back to the file
+        state['filename'] = None
+
+        if self.shared_memory is not None:
+            for name, _ in FIELDS:
+                del state[name]
+            state['shared_memory'] = self.shared_memory.name
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.shared_memory, str):
+            self.shared_memory = shared_memory.SharedMemory(name=self.shared_memory)
+            self._attach(self.shared_memory.buf)
+
+    """
+    Create the arrays of the table as views of a single buffer.
+    """
+    def _attach(self, buffer):
+        offset = 0
+        for name, dtype in FIELDS:
+            setattr(self, name, np.ndarray(self.capacity, dtype=dtype, buffer=buffer, offset=offset))
+            offset += self.capacity * np.dtype(dtype).itemsize
+
+    """
+    Move the table into shared memory so that worker processes update the
+    same statistics. New entries are then added under a lock.
+    """
+    def share(self):
+
+        if self.shared_memory is not None:
+            return
+
+        # copy the current statistics into the shared block
+        arrays = [getattr(self, name) for name, _ in FIELDS]
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=self.capacity * ENTRY_BYTES)
+        self._attach(self.shared_memory.buf)
+        for (name, _), array in zip(FIELDS, arrays):
+            getattr(self, name)[:] = array
+
+        self.lock = multiprocessing.Lock()
+
+        # free the block when the table is deleted
+        weakref.finalize(self, _release, self.shared_memory)
+
+    """
+    Recount the filled slots, which is needed after other processes have
+    added entries to a shared table.
+    """
+    def recount(self):
+        self.count = int(np.count_nonzero(self.keys))
+
+    """
+    Start a new search generation so that entries from older searches are
+    replaced before those from the current one.
+    """
+    def next_generation(self):
+        self.generation += 1
+
+    """
+    Return the slot holding the key or -1 if it is not in the table.
+    """
+    def find(self, key):
+
+        # 0 is reserved for empty slots
+        key = key or 1
+
+        self.probes += 1
+        start = key & self.mask
+        for i in range(self.probe_limit):
+            idx = (start + i) & self.mask
+            slot_key = self.keys.item(idx)
+
+            if slot_key == key:
+                self.hits += 1
+                return idx
+
+            # the key would have been placed here
+            if slot_key == 0:
+                return -1
+
+        return -1
+
+    """
+    Return the slot holding the key, adding an empty entry if it is not in the table.
+    """
+    def store(self, key):
+
+        idx = self.find(key)
+        if idx >= 0:
+            self.ages[idx] = self.generation
+            return idx
+
+        if self.lock is None:
+            return self._insert(key)
+
+        # stop two processes claiming the same slot
+        with self.lock:
+            return self._insert(key)
+
+    """
+    Add an empty entry for the key. When all the candidate slots are full
+    the entry from the oldest generation with the fewest plays is replaced.
+    """
+    def _insert(self, key):
+
+        # 0 is reserved for empty slots
+        key = key or 1
+
+        start = key & self.mask
+        victim, victim_score = -1, None
+
+        for i in range(self.probe_limit):
+            idx = (start + i) & self.mask
+            slot_key = self.keys.item(idx)
+
+            # another process may have added the key
+            if slot_key == key:
+                self.ages[idx] = self.generation
+                return idx
+
+            # claim an empty slot
+            if slot_key == 0:
+                victim = idx
+                self.count += 1
+                break
+
+            # rank the slot for replacement
+            score = (self.ages.item(idx) == self.generation, self.plays.item(idx))
+            if victim_score is None or score < victim_score:
+                victim, victim_score = idx, score
+
+        # add a fresh entry
+        self.plays[victim] = 0
+        self.values[victim] = 0
+        self.ages[victim] = self.generation
+        self.virtual[victim] = 0
+        self.keys[victim] = key
+
+        return victim
+
+    """
+    Return the plays and value for the key, or zeros if it is not in the table.
+    If a virtual value is given each in-flight visit is counted as a play
+    with that value.
+    """
+    def get(self, key, virtual_value=None):
+        idx = self.find(key)
+        if idx < 0:
+            return 0, 0.0
+
+        plays, value = self.plays.item(idx), self.values.item(idx)
+
+        if virtual_value is not None:
+            virtual = self.virtual.item(idx)
+            if virtual > 0:
+                value = (value * plays + virtual_value * virtual) / (plays + virtual)
+                plays += virtual
+
+        return plays, value
+
+    """
+    Add (or remove) in-flight visits to the entry for the key. Visits are only
+    removed from an entry still in the table and never below zero, since 
+    the entry may have been replaced and added again while they were in flight.
+    """
+    def add_virtual(self, key, amount):
+
+        idx = self.store(key) if amount > 0 else self.find(key)
+        if idx < 0:
+            return
+
+        if self.lock is None:
+            self.virtual[idx] = max(self.virtual.item(idx) + amount, 0)
+            return
+
+        # stop the updates of other processes being lost
+        with self.lock:
+            self.virtual[idx] = max(self.virtual.item(idx) + amount, 0)
+
+    """
+    Return a copy of the keys, plays and values used to find the changes
+    made to the table since this point.
+    """
+    def snapshot(self):
+        return self.keys.copy(), self.plays.copy(), self.values.copy()
+
+    """
+    Return the keys of the entries changed since the snapshot with the
+    plays and total value added to each.
+    """
+    def changes(self, snapshot):
+        keys, plays, values = snapshot
+
+        # slots which now hold a different key start from nothing
+        changed = np.flatnonzero((self.keys != keys) | (self.plays != plays))
+        replaced = self.keys[changed] != keys[changed]
+        base_plays = np.where(replaced, 0, plays[changed])
+        base_values = np.where(replaced, 0, values[changed])
+
+        new_plays, new_values = self.plays[changed], self.values[changed]
+        delta_plays = new_plays - base_plays
+        delta_values = new_values * new_plays - base_values * base_plays
+
+        return self.keys[changed], delta_plays, delta_values
+
+    """
+    Add plays and total values to the entries for the keys, averaging
+    the values by the number of plays.
+    """
+    def merge(self, keys, delta_plays, delta_values):
+        for key, delta_play, delta_value in zip(keys.tolist(), delta_plays.tolist(), delta_values.tolist()):
+
+            slot = self.store(key)
+            plays = self.plays.item(slot)
+            total_plays = plays + delta_play
+
+            if total_plays > 0:
+                self.values[slot] = (self.values.item(slot) * plays + delta_value) / total_plays
+            self.plays[slot] = total_plays
+
+    """
+    Remove all the entries from the table.
+    """
+    def clear(self):
+        for name, _ in FIELDS:
+            getattr(self, name).fill(0)
+        self.generation = 0
+        self.count = 0
+
+        # the removed entries are not tracked, so the next save writes a new file
+        self.filename = None
+        self.saved_generation = 0
+
+    """
+    Save the table to a memory-mapped file. If the table was saved to or 
+    opened from the file to save back to it, only the entries changed since 
+    are written, otherwise the filled entries are copied to a new file. 
+    Changes never reach the file between saves.
+    """
+    def save(self, filename):
+
+        if self.filename == filename:
+            mapped = np.memmap(filename, dtype=np.uint8, mode='r+')
+            self._write_entries(mapped, np.flatnonzero(self.ages > self.saved_generation))
+            self._write_header(mapped)
+            mapped.flush()
+
+        else:
+            # write to a temporary file so that the old file is never left half written
+            temp_filename = filename + '.tmp'
+            mapped = np.memmap(temp_filename, dtype=np.uint8, mode='w+', shape=(HEADER_BYTES + self.capacity * ENTRY_BYTES,))
+            self._write_header(mapped)
+
+            # the new file is empty so only the filled entries are copied
+            self._write_entries(mapped, np.flatnonzero(self.keys))
+            mapped.flush()
+            os.replace(temp_filename, filename)
+
+            # use the file in place of the arrays, unless they are shared
+            if self.shared_memory is None:
+                self._attach(np.memmap(filename, dtype=np.uint8, mode='c')[HEADER_BYTES:])
+            self.filename = filename
+
+        # entries changed from now on are newer than the save
+        self.saved_generation = self.generation
+        self.next_generation()
+
+    """
+    Write the entries in the given slots to a mapped file. In-flight visits 
+    are never saved.
+    """
+    def _write_entries(self, mapped, slots):
+        offset = HEADER_BYTES
+        for name, dtype in FIELDS:
+            array = np.ndarray(self.capacity, dtype=dtype, buffer=mapped, offset=offset)
+            array[slots] = 0 if name == 'virtual' else getattr(self, name)[slots]
+            offset += self.capacity * np.dtype(dtype).itemsize
+
+    """
+    Open a table saved to a memory-mapped file. Entries are only read from disk
+    when they are used and changes are kept in memory. A writable table saves 
+    back to the same file by only writing the entries changed.
+    """
+    @classmethod
+    def open(cls, filename, writable=False):
+
+        mapped = np.memmap(filename, dtype=np.uint8, mode='c')
+        header = np.ndarray(8, dtype=np.uint64, buffer=mapped)
+
+        # ensure the file is correct
+        assert int(header[0]) == FILE_MARKER, "{} is not a saved table".format(filename)
+
+        table = cls(capacity=int(header[1]), probe_limit=int(header[2]))
+        table._attach(mapped[HEADER_BYTES:])
+        table.generation = int(header[3])
+        table.count = int(header[4])
+
+        if writable:
+            table.filename = filename
+            table.saved_generation = table.generation
+            table.next_generation()
+
+        return table
+
+    """
+    Stop saving changes back to the file, so that a forked worker process 
+    can update its own copy of the table. The mapping of the file is copy 
+    on write, so the changes of the worker are already private.
+    """
+    def make_private(self):
+        self.filename = None
+
+    """
+    Write the details of the table to the start of a mapped file.
+    """
+    def _write_header(self, mapped):
+        header = np.ndarray(8, dtype=np.uint64, buffer=mapped)
+        header[:5] = [FILE_MARKER, self.capacity, self.probe_limit, self.generation, self.count]
+
+
+"""
+Close and remove a shared memory block.
+"""
+def _release(block):
+
+    # the arrays may still be in use while the interpreter exits
+    try:
+        block.close()
+    except BufferError:
+        pass
+    block.unlink()
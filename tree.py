@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:21:10 2026
+
+@author: hemerson
+"""
+
+"""
+Defines a node of the Monte Carlo search tree. The legal moves and the hashes
+of the resulting positions are cached when the node is first expanded, so
+repeat visits do not need to generate moves or hash boards again. The plays
+and values of each position are kept in the transposition table under the
+child keys.
+"""
+class Node:
+    __slots__ = ('key', 'player', 'moves', 'child_keys', 'children', 'expanded')
+
+    def __init__(self, key, player):
+
+        # the hash of the position and the player to move
+        self.key = key
+        self.player = player
+
+        # the packed integer for each legal move, the hash after each
+        # move and the child nodes created so far
+        self.moves = list()
+        self.child_keys = list()
+        self.children = list()
+        self.expanded = False
+
+    """
+    Return the node reached by the move at the given index, creating it if
+    it has not been visited through this node before.
+    """
+    def child(self, index, player):
+        if self.children[index] is None:
+            self.children[index] = Node(self.child_keys[index], player)
+        return self.children[index]